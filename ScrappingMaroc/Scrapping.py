@@ -3,6 +3,7 @@ import time
 import os
 import certifi
 import hashlib
+from datetime import datetime
 from bs4 import BeautifulSoup
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -10,7 +11,7 @@ from selenium.webdriver.chrome.service import Service as ChromeService
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.support.ui import Select
-from pymongo import MongoClient, InsertOne
+from pymongo import MongoClient, InsertOne, ASCENDING, DESCENDING, TEXT
 from dotenv import load_dotenv
 
 # --- Configuration ---
@@ -35,6 +36,18 @@ def generer_liens(lien_initial: str):
     lien_final = lien_final.replace("orgAcronyme=", "orgAcronym=")
     return lien_final
 
+def convertir_date(texte):
+    """
+    Convertit une date du site ("jj/mm/aaaa" ou "jj/mm/aaaa HH:MM", heure du Maroc) en datetime, ou None.
+    La date est stockée telle quelle (sans fuseau) : l'application la compare à l'heure locale.
+    """
+    for format_date in ("%d/%m/%Y %H:%M", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(texte.strip(), format_date)
+        except (ValueError, AttributeError):
+            continue
+    return None
+
 def parse_html(html_content):
     if not html_content: return []
     soup = BeautifulSoup(html_content, 'html.parser')
@@ -89,11 +102,16 @@ def parse_html(html_content):
                 "type_procedure": type_procedure,
                 "domaine": domaine,
                 "date_publication": date_publication,
+                # Dates au format BSON, pour trier et filtrer dans MongoDB
+                "date_publication_dt": convertir_date(date_publication),
                 "reference": reference,
                 "objet": objet,
                 "acheteur_public": acheteur,
                 "lieu_execution": lieu,
+                # Liste des provinces, pour filtrer par l'index (provinces, date_publication_dt)
+                "provinces": [p.strip() for p in lieu.split(',') if p.strip() and p.strip() != '-'],
                 "date_limite_remise_plis": date_limite,
+                "date_limite_remise_plis_dt": convertir_date(date_limite),
                 "lien_details": lien_complet,
                 "lien_dossier_direct": lien_dossier
             }
@@ -103,6 +121,22 @@ def parse_html(html_content):
             
     return offres
 
+def creer_index(collection):
+    """
+    Index utilisés par l'application (mêmes définitions que INDEX_CONSULTATIONS dans StreamlitScript/consultations.py) :
+    tri par date de publication, filtres par acheteur, domaine et province suivis du tri, date limite,
+    et recherche plein texte en français sur l'objet et la référence.
+    """
+    collection.create_index([("date_publication_dt", DESCENDING), ("_id", DESCENDING)])
+    collection.create_index([("acheteur_public", ASCENDING), ("date_publication_dt", DESCENDING)])
+    collection.create_index([("domaine", ASCENDING), ("date_publication_dt", DESCENDING)])
+    collection.create_index([("provinces", ASCENDING), ("date_publication_dt", DESCENDING)])
+    collection.create_index([("date_limite_remise_plis_dt", ASCENDING)])
+    collection.create_index(
+        [("objet", TEXT), ("reference", TEXT)],
+        default_language="french", weights={"reference": 5, "objet": 1}
+    )
+
 def save_to_mongodb(data_list):
     if not MONGO_URI:
         print("Erreur: MONGO_URI n'est pas configuré.")
@@ -127,6 +161,7 @@ def save_to_mongodb(data_list):
             result = collection.bulk_write(operations)
             print("Sauvegarde dans MongoDB terminée.")
             print(f"  - {result.inserted_count} offres insérées.")
+        creer_index(collection)
         
     except Exception as e:
         print(f"Une erreur est survenue avec MongoDB : {e}")
@@ -5,32 +5,55 @@ import weaviate
 import queue
 import weaviate.classes.query as wq
 import weaviate.classes.config as wvc
-from sentence_transformers import SentenceTransformer
+from weaviate.util import generate_uuid5
 import os
 import requests
 import zipfile
-import io
+import tempfile
 import time
-from pypdf import PdfReader
-import docx
-import pandas as pd
 import shutil
-from PIL import Image
 import pytesseract
-from pdf2image import convert_from_path
 from datetime import datetime, timezone
 from pathlib import Path
+from urllib.parse import urlparse, parse_qs
 import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
 from pymongo import MongoClient
 import certifi
 from dotenv import load_dotenv
 import subprocess
+from cache_local import CacheEmbeddings, CacheExtraction, CacheLRU, normaliser_texte
+from extraction_documents import (
+    initialiser_worker, soumettre_ocr_pdf, lire_pages_pdf, ocr_image, extraire_texte_docx, extraire_texte_excel
+)
+import threading
+from vectorisation import MicroBatcher, EncodeurParBuckets
+from insertion_weaviate import ouvrir_lot, reinserer_echecs, resumer_echecs
+from decoupage import decouper_texte, CompteurRepetitionsDossier
+import hashlib
+from conversion_libreoffice import PoolLibreOffice
+from consultations import (construire_filtre, charger_page, options_filtres, provinces_de, assurer_index,
+                           mettre_a_niveau_documents)
+from modeles_embedding import MODELES, charger_modele, nom_cache
+from sentence_transformers import CrossEncoder
+from reindexation import reindexer, assurer_vecteurs_nommes
+from reduction_dimension import charger_reduction, nom_vecteur
+from index_vectoriel import config_index_hnsw, activer_compression, regler_ef
+import atexit
 
 # --- Configuration de la Page et des Constantes ---
 st.set_page_config(layout="wide", page_title="Assistant d'Appels d'Offres")
 
-NOM_DU_MODELE_DE_VECTEUR = 'BAAI/bge-base-en-v1.5'
+# Le fichier .env est lu avant les constantes : plusieurs réglages ci-dessous peuvent y être définis
+load_dotenv()
+
+# Modèle actif, choisi dans le registre MODELES (modeles_embedding.py). Le corpus étant en français,
+# préférer un modèle multilingue ("multilingual_e5_small" ou "bge_m3"), puis revectoriser l'existant avec reindexation.py
+MODELE_EMBEDDING = os.getenv("MODELE_EMBEDDING", "bge_base_en")
+NOM_DU_MODELE_DE_VECTEUR = MODELES[MODELE_EMBEDDING]["nom"]
 CLASS_NAME = "DocumentParagraph"
+# Registre des appels d'offres déjà indexés (un objet par tender_ref)
+DOSSIERS_CLASS_NAME = "DossierIndexe"
 def find_project_root(start_path):
     # On commence depuis le chemin du script actuel
     current_path = Path(start_path).resolve()
@@ -48,56 +71,195 @@ def find_project_root(start_path):
 ROOT_DIRECTORY = find_project_root(__file__)
 # Cette ligne définit le dossier des documents à la racine
 FILES_DIRECTORY = ROOT_DIRECTORY / "documents"
+# Cache persistant des vecteurs de paragraphes (partagé entre les appels d'offres)
+CACHE_DIRECTORY = ROOT_DIRECTORY / "cache"
+TAILLE_MAX_CACHE_EMBEDDINGS = 500_000
+# Vecteurs de dimension réduite (ex : 256) pour économiser la mémoire de Weaviate ; vide = pleine dimension.
+# La projection PCA se mesure et s'apprend avec reduction_dimension.py, et est rangée dans PROJECTIONS_DIRECTORY
+DIMENSION_REDUITE = int(os.getenv("DIMENSION_REDUITE", "0")) or None
+PROJECTIONS_DIRECTORY = ROOT_DIRECTORY / "projections"
+# Nom du vecteur nommé utilisé à l'indexation et à la recherche (modèle actif + éventuelle dimension réduite)
+NOM_VECTEUR = nom_vecteur(MODELE_EMBEDDING, DIMENSION_REDUITE)
+# Index HNSW des vecteurs et compression en mémoire ("aucune", "pq", "bq" ou "sq"), à choisir avec benchmark_index.py.
+# efConstruction et maxConnections ne s'appliquent qu'aux vecteurs nommés créés ensuite ; ef est modifiable à tout moment.
+COMPRESSION_VECTEURS = os.getenv("COMPRESSION_VECTEURS", "aucune")
+HNSW_EF = int(os.getenv("HNSW_EF", "-1"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "128"))
+HNSW_MAX_CONNECTIONS = int(os.getenv("HNSW_MAX_CONNECTIONS", "32"))
+# Nombre de candidats re-classés avec les vecteurs d'origine (BQ/SQ)
+RESCORE_LIMIT = int(os.getenv("RESCORE_LIMIT", "256"))
+# Nombre de paragraphes à partir duquel la compression PQ/SQ est apprise puis activée
+TAILLE_ENTRAINEMENT_COMPRESSION = 100_000
+# À incrémenter quand la logique d'extraction change (invalide le cache des textes extraits)
+VERSION_EXTRACTION = "4"
+# En dessous de ce nombre de caractères, une page PDF est considérée comme scannée et passe à l'OCR
+SEUIL_CARACTERES_PAGE = 30
+# Taille des blocs écrits sur disque pendant le téléchargement des dossiers (DCE)
+TAILLE_BLOC_TELECHARGEMENT = 1024 * 1024
+# Garde-fous contre les archives piégées (zip bombs) et les ZIP imbriqués trop profonds
+PROFONDEUR_MAX_ZIP = 5
+NB_MAX_FICHIERS_ZIP = 5000
+TAILLE_MAX_DECOMPRESSEE_ZIP = 2 * 1024 ** 3
+# Les ZIP imbriqués restent en mémoire jusqu'à cette taille, puis sont déversés sur disque
+TAILLE_SPOOL_ZIP = 32 * 1024 * 1024
+# Nombre d'instances LibreOffice gardées prêtes pour la conversion .doc/.rtf -> .docx
+NB_INSTANCES_LIBREOFFICE = 3
+TIMEOUT_CONVERSION = 120
+# Nombre de processus pour l'extraction du texte et l'OCR (par défaut : un par cœur)
+NB_PROCESSUS_EXTRACTION = int(os.getenv("NB_PROCESSUS_EXTRACTION", os.cpu_count() or 1))
+# Micro-batching : un lot de paragraphes (tous fichiers confondus) est envoyé au modèle dès qu'il atteint
+# TAILLE_LOT_EMBEDDING paragraphes, ou dès que le plus ancien attend depuis DELAI_MAX_LOT secondes
+TAILLE_LOT_EMBEDDING = 256
+DELAI_MAX_LOT = 0.5
+# Insertion dans Weaviate par le batching du client (gRPC) : "fixed_size" ou "dynamic" (taille adaptée à la charge)
+MODE_LOT_WEAVIATE = os.getenv("MODE_LOT_WEAVIATE", "fixed_size")
+TAILLE_LOT_WEAVIATE = 200
+REQUETES_CONCURRENTES_WEAVIATE = 2
+# Nombre de nouvelles tentatives pour les objets refusés par Weaviate
+TENTATIVES_INSERTION = 3
+# Backend CPU du modèle : "torch" (float32), "onnx", "int8" ou "onnx-int8".
+# Vérifier la précision d'un backend avant de l'utiliser : python modeles_embedding.py --backend onnx-int8
+BACKEND_EMBEDDING = os.getenv("BACKEND_EMBEDDING", "torch")
+# Recherche hybride : alpha = 0 -> mots-clés seuls (BM25 sur "content"), alpha = 1 -> similarité vectorielle seule
+ALPHA_HYBRIDE = 0.5
+# Reclassement optionnel des meilleurs candidats par un cross-encoder multilingue (sur CPU)
+NOM_DU_RERANKER = os.getenv("NOM_DU_RERANKER", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+NB_CANDIDATS_RERANKING = 30
+# Caches en mémoire de la recherche : vecteurs des requêtes, et résultats par (requête, appel d'offres, k, réglages)
+TAILLE_MAX_CACHE_REQUETES = 1000
+TAILLE_MAX_CACHE_RESULTATS = 500
 
 # --- Fonctions Utilitaires et de Chargement ---
 
 @st.cache_resource
 def load_model():
-    """Charge le modèle de vectorisation une seule fois."""
-    return SentenceTransformer(NOM_DU_MODELE_DE_VECTEUR)
+    """Charge le modèle de vectorisation une seule fois, avec le backend choisi (même interface `encode`)."""
+    return charger_modele(NOM_DU_MODELE_DE_VECTEUR, BACKEND_EMBEDDING, CACHE_DIRECTORY)
 
-@st.cache_data(ttl=3600)
-def load_data_from_mongo():
-    """Charge les données des appels d'offres directement depuis MongoDB Atlas."""
+@st.cache_resource
+def load_reranker():
+    """Charge le cross-encoder de reclassement une seule fois (sur CPU)."""
+    return CrossEncoder(NOM_DU_RERANKER, device="cpu")
+
+@st.cache_resource
+def load_cache_embeddings():
+    """Ouvre le cache des vecteurs une seule fois (clé : modèle + backend + texte normalisé)."""
+    return CacheEmbeddings(
+        str(CACHE_DIRECTORY / "embeddings.sqlite"), nom_cache(NOM_DU_MODELE_DE_VECTEUR, BACKEND_EMBEDDING), TAILLE_MAX_CACHE_EMBEDDINGS
+    )
+
+@st.cache_resource
+def load_caches_recherche():
+    """Caches LRU de la recherche, communs à toutes les sessions : (vecteurs des requêtes, résultats)."""
+    return CacheLRU(TAILLE_MAX_CACHE_REQUETES), CacheLRU(TAILLE_MAX_CACHE_RESULTATS)
+
+@st.cache_resource
+def load_reduction():
+    """Charge une seule fois la projection vers la dimension réduite (None en pleine dimension)."""
+    return charger_reduction(MODELE_EMBEDDING, DIMENSION_REDUITE, str(PROJECTIONS_DIRECTORY))
+
+@st.cache_resource
+def load_cache_extraction():
+    """Ouvre le cache des textes extraits une seule fois (clé : empreinte du fichier)."""
+    return CacheExtraction(str(CACHE_DIRECTORY / "extractions.sqlite"), VERSION_EXTRACTION)
+
+@st.cache_resource
+def load_pool_extraction():
+    """Démarre une seule fois le pool de processus utilisé pour l'extraction du texte et l'OCR."""
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=NB_PROCESSUS_EXTRACTION,
+        initializer=initialiser_worker,
+        initargs=(pytesseract.pytesseract.tesseract_cmd,)
+    )
+
+_verrou_pool_extraction = threading.Lock()
+
+def recreer_pool_extraction(pool_casse):
+    """
+    Un processus du pool mort (mémoire insuffisante sur un gros scan, plantage de poppler ou de Tesseract)
+    rend le pool inutilisable pour toutes les tâches suivantes : il est arrêté et retiré du cache,
+    le prochain appel à load_pool_extraction() en démarre un nouveau. Un seul thread le recrée.
+    """
+    with _verrou_pool_extraction:
+        if load_pool_extraction() is pool_casse:
+            load_pool_extraction.clear()
+            pool_casse.shutdown(wait=False, cancel_futures=True)
+
+def executer_dans_pool(fonction, *args, **kwargs):
+    """Exécute `fonction` dans le pool de processus et attend son résultat ; une nouvelle tentative si le pool est cassé."""
+    pool = load_pool_extraction()
+    try:
+        return pool.submit(fonction, *args, **kwargs).result()
+    except BrokenProcessPool:
+        recreer_pool_extraction(pool)
+        return load_pool_extraction().submit(fonction, *args, **kwargs).result()
+
+@st.cache_resource
+def load_pool_libreoffice():
+    """Démarre une seule fois les instances LibreOffice utilisées pour la conversion en .docx."""
+    pool = PoolLibreOffice(NB_INSTANCES_LIBREOFFICE)
+    atexit.register(pool.arreter)
+    return pool
+
+@st.cache_resource
+def load_collection_consultations():
+    """Ouvre une seule fois la connexion à MongoDB Atlas et retourne la collection des appels d'offres."""
     # MODIFIÉ : Utilisation de la nouvelle variable d'environnement MONGO2_URI
     MONGO_URI = os.getenv("MONGO2_URI")
     if not MONGO_URI:
         st.error("La variable d'environnement MONGO2_URI n'est pas définie !")
-        return [], {}
+        return None
+    client = MongoClient(MONGO_URI, tls=True, tlsCAFile=certifi.where(), serverSelectionTimeoutMS=10000)
+    collection = client.marchespublics_db.consultations
+    # Le tri et le filtre de clôture portent sur les dates BSON : les documents importés par une ancienne version
+    # du scraper sont complétés avant le premier affichage (sans effet une fois la collection à niveau)
     try:
-        client = MongoClient(MONGO_URI, tls=True, tlsCAFile=certifi.where(), serverSelectionTimeoutMS=10000)
-        db = client.marchespublics_db
-        collection = db.consultations
-        # MODIFIÉ : On récupère toutes les données sans tri, le tri se fera en Python
-        data = list(collection.find({}))
-        client.close()
-
-        # MODIFIÉ : Le tri est fait ici car le format de date "jj/mm/aaaa" n'est pas triable directement dans MongoDB
-        data.sort(key=lambda x: datetime.strptime(x.get('date_publication', '01/01/1970'), "%d/%m/%Y"), reverse=True)
-
-        acheteurs, provinces, domaines = set(), set(), set()
-        for item in data:
-            # MODIFIÉ : Utilisation des nouveaux noms de champs de la base de données
-            if item.get("acheteur_public"): acheteurs.add(item["acheteur_public"])
-            if item.get("domaine"): domaines.add(item["domaine"])
-            # MODIFIÉ : On traite la chaîne de caractères "lieu_execution" pour extraire une liste de provinces
-            if item.get("lieu_execution"):
-                # On crée une nouvelle clé "provinces_list" pour une utilisation facile plus tard
-                item['provinces_list'] = [p.strip() for p in item["lieu_execution"].split(',') if p.strip() and p.strip() != '-']
-                provinces.update(item['provinces_list'])
-
-        return data, {
-            "acheteurs": sorted(list(acheteurs)),
-            "provinces": sorted(list(provinces)),
-            "domaines": sorted(list(domaines))
-        }
+        nb_mis_a_niveau = mettre_a_niveau_documents(collection)
+        if nb_mis_a_niveau:
+            st.info(f"{nb_mis_a_niveau} appel(s) d'offres mis à niveau (dates et provinces).")
+    except Exception as e:
+        st.warning(f"Mise à niveau des appels d'offres impossible : {e}")
+    # Index des filtres, du tri et de la recherche par mot-clé ($text)
+    try:
+        assurer_index(collection)
+    except Exception as e:
+        st.warning(f"Index MongoDB non vérifiés : {e}")
+    return collection
+
+@st.cache_data(ttl=3600)
+def load_filter_options():
+    """Valeurs des filtres (acheteurs, provinces, domaines), calculées par MongoDB."""
+    collection = load_collection_consultations()
+    if collection is None:
+        return {"acheteurs": [], "provinces": [], "domaines": []}
+    try:
+        return options_filtres(collection)
     except Exception as e:
         st.error(f"Erreur de connexion à MongoDB : {e}")
-        return [], {}
+        return {"acheteurs": [], "provinces": [], "domaines": []}
+
+@st.cache_data(ttl=3600)
+def load_page_consultations(mot_cle, acheteurs, provinces, domaines, cloture_dans_jours, page, par_page):
+    """
+    Une page d'appels d'offres filtrés, triés et paginés par MongoDB (seuls les champs affichés sont lus).
+    Retourne (appels d'offres de la page, nombre total de résultats).
+    """
+    # MODIFIÉ : Auparavant, toute la collection était chargée puis triée et filtrée en Python
+    collection = load_collection_consultations()
+    if collection is None:
+        return [], 0
+    filtre = construire_filtre(mot_cle, acheteurs, provinces, domaines, cloture_dans_jours)
+    items = charger_page(collection, filtre, page, par_page)
+    for item in items:
+        item["provinces_list"] = item.get("provinces") or provinces_de(item)
+    return items, collection.count_documents(filtre)
 
 def format_date(date_string):
     """Formate une date en format lisible."""
     if not date_string: return "N/A"
+    # MODIFIÉ : Les dates sont stockées en datetime par le scraper (les chaînes restent lues pour les anciens documents)
+    if isinstance(date_string, datetime):
+        return date_string.strftime("%A %d/%m/%Y %H:%M" if (date_string.hour, date_string.minute) != (0, 0) else "%A %d/%m/%Y")
     try:
         # MODIFIÉ : Essaye de lire le format "jj/mm/aaaa HH:MM"
         dt_object = datetime.strptime(date_string, "%d/%m/%Y %H:%M")
@@ -114,136 +276,376 @@ def jours_restants(date_string):
     """Calcule le nombre de jours restants avant une date."""
     if not date_string: return ""
     try:
-        # MODIFIÉ : La date est maintenant lue au format "jj/mm/aaaa HH:MM"
-        end_date = datetime.strptime(date_string, "%d/%m/%Y %H:%M")
+        # MODIFIÉ : La date est maintenant lue au format "jj/mm/aaaa HH:MM", ou directement en datetime
+        end_date = date_string if isinstance(date_string, datetime) else datetime.strptime(date_string, "%d/%m/%Y %H:%M")
         now = datetime.now() # On utilise la date et heure actuelles (naïve)
         delta = end_date - now
         return f"⏳ Il reste {delta.days} jour(s)" if delta.days >= 0 else "Terminé"
     except (ValueError, TypeError):
         return ""
 
-# --- Fonctions d'Extraction de Texte (INCHANGÉES) ---
+def calculer_tender_ref(item):
+    """Construit un identifiant stable de l'appel d'offres (organisme + n° de consultation)."""
+    # La "reference" affichée n'est pas unique d'un acheteur à l'autre, et "_id" change à chaque scraping :
+    # on se base donc sur les paramètres du lien de téléchargement direct.
+    params = parse_qs(urlparse(item.get("lien_dossier_direct") or "").query)
+    org = params.get("orgAcronym", [""])[0]
+    ref_consultation = params.get("reference", [""])[0]
+    if org and ref_consultation:
+        return f"{org}_{ref_consultation}"
+    return str(item.get("reference") or item.get("_id"))
+
+def dossier_local(tender_ref):
+    """Retourne le dossier local des fichiers d'un appel d'offres."""
+    nom_sur = "".join(c if c.isalnum() or c in "-_" else "_" for c in tender_ref)
+    return FILES_DIRECTORY / nom_sur
+
+# --- Fonctions d'Extraction de Texte ---
+# MODIFIÉ : Le travail CPU (lecture PDF, OCR, Word, Excel) est exécuté dans le pool de processus
+# (voir extraction_documents.py) ; ces fonctions ne font que répartir les tâches et assembler les résultats.
+
 # Intérêt du code : Ajoute une fonction dédiée à la lecture du texte contenu dans les fichiers images.
 def extraire_texte_image_ocr(chemin_fichier):
     """
     Extrait le texte d'un fichier image en utilisant Pytesseract (OCR).
     """
     try:
-        # On utilise la librairie Pillow (Image) pour ouvrir le fichier image
-        img = Image.open(chemin_fichier)
-        # On utilise pytesseract pour convertir l'image en chaîne de caractères
-        texte = pytesseract.image_to_string(img, lang='fra')
+        texte = executer_dans_pool(ocr_image, chemin_fichier)
         # On retourne le texte et on indique que l'OCR a été utilisé
-        return texte, True
+        return texte, True, []
+    except BrokenProcessPool:
+        # Pool de nouveau cassé : le fichier est en erreur (et non vide), le dossier ne sera pas marqué indexé
+        raise
     except Exception as e:
-        st.warning(f"Avertissement OCR sur l'image {os.path.basename(chemin_fichier)}: {e}")
-        return "", True 
+        # MODIFIÉ : L'échec est retourné (un st.warning depuis un thread d'extraction n'apparaît pas sur la page)
+        return "", True, [f"OCR de l'image impossible : {e}"]
     
-def extraire_texte_images_pdf_ocr(chemin_fichier):
-    texte_ocr = ""
+def extraire_texte_images_pdf_ocr(chemin_fichier, pages=None, nouvelle_tentative=True):
+    """
+    OCRise les pages demandées du PDF (toutes par défaut).
+    Retourne ({numero_page: texte}, erreurs) ; `erreurs` liste les fenêtres de pages qui n'ont pas pu être OCRisées.
+    """
+    textes_ocr = {}
+    erreurs = []
+    pool = load_pool_extraction()
     try:
-        images = convert_from_path(chemin_fichier)
-        for img in images:
-            texte_ocr += pytesseract.image_to_string(img, lang='fra') + "\n"
+        # MODIFIÉ : Les pages sont rendues par petites fenêtres et OCRisées en parallèle
+        fenetres = soumettre_ocr_pdf(pool, chemin_fichier, NB_PROCESSUS_EXTRACTION, pages=pages)
+        for numeros_pages, future in fenetres:
+            try:
+                textes_ocr.update(zip(numeros_pages, future.result()))
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                erreurs.append(f"OCR des pages {numeros_pages[0]}-{numeros_pages[-1]} impossible : {e}")
+    except BrokenProcessPool:
+        # Pool cassé pendant l'OCR : il est recréé et l'OCR du fichier relancé une fois
+        recreer_pool_extraction(pool)
+        if not nouvelle_tentative:
+            raise
+        return extraire_texte_images_pdf_ocr(chemin_fichier, pages, nouvelle_tentative=False)
     except Exception as e:
-        st.warning(f"Avertissement OCR sur {os.path.basename(chemin_fichier)}: {e}")
-    return texte_ocr
+        erreurs.append(f"OCR impossible : {e}")
+    return textes_ocr, erreurs
 
 def extraire_texte_pdf(chemin_fichier):
-    texte_normal = ""
-    ocr_utilise = False
-    try:
-        with open(chemin_fichier, "rb") as f:
-            reader = PdfReader(f)
-            for page in reader.pages:
-                contenu = page.extract_text()
-                if contenu: texte_normal += contenu + "\n"
-    except Exception: pass
-
-    if len(texte_normal.strip()) < 100:
-        texte_ocr = extraire_texte_images_pdf_ocr(chemin_fichier)
-        if texte_ocr:
-            ocr_utilise = True
-            return texte_ocr, ocr_utilise
-    return texte_normal, ocr_utilise
-
-def extraire_texte_docx(chemin_fichier):
+    # MODIFIÉ : Décision page par page : on garde la couche texte quand elle existe
+    # et on n'OCRise que les pages (annexes scannées...) sans texte exploitable
     try:
-        document = docx.Document(chemin_fichier)
-        return "\n".join([para.text for para in document.paragraphs if para.text.strip()])
-    except Exception as e: raise Exception(f"Erreur DOCX: {e}")
+        textes_pages, pages_a_ocr = executer_dans_pool(
+            lire_pages_pdf, chemin_fichier, SEUIL_CARACTERES_PAGE
+        )
+    except BrokenProcessPool:
+        raise
+    except Exception as e:
+        # Lecture impossible : on tente l'OCR de toutes les pages
+        st.warning(f"Avertissement lecture PDF sur {os.path.basename(chemin_fichier)}: {e}")
+        textes_pages, pages_a_ocr = [], None
 
-def extraire_texte_excel(chemin_fichier):
-    try:
-        df = pd.read_excel(chemin_fichier, sheet_name=None, header=None)
-        texte = ""
-        for sheet_name, sheet_df in df.items():
-            texte += sheet_df.to_string(index=False, header=False) + "\n"
-        return texte
-    except Exception as e: raise Exception(f"Erreur Excel: {e}")
+    textes_ocr, erreurs = extraire_texte_images_pdf_ocr(chemin_fichier, pages_a_ocr) if pages_a_ocr is None or pages_a_ocr else ({}, [])
+    ocr_utilise = any(t.strip() for t in textes_ocr.values())
+    nb_pages = max([len(textes_pages)] + list(textes_ocr))
+    pages = []
+    for numero_page in range(1, nb_pages + 1):
+        contenu = textes_ocr.get(numero_page, "")
+        if not contenu.strip() and numero_page <= len(textes_pages):
+            contenu = textes_pages[numero_page - 1]
+        if contenu: pages.append(contenu)
+    # MODIFIÉ : Pages séparées par un saut de page ("\f") pour repérer les en-têtes et pieds de page répétés
+    return "\f".join(pages), ocr_utilise, erreurs
 
-def decouper_texte(texte):
-    return [p.strip() for p in texte.split("\n") if len(p.strip()) > 10]
+def extraire_texte_fichier(chemin_fichier):
+    """
+    Extrait le texte d'un fichier selon son extension. Retourne (texte, ocr_utilise, erreurs) ;
+    si `erreurs` n'est pas vide, le texte est incomplet (pages ou image que l'OCR n'a pas pu lire).
+    """
+    extension = os.path.splitext(chemin_fichier)[1].lower()
+    # MODIFIÉ : On définit une liste d'extensions d'images reconnues
+    extensions_images = ('.png', '.jpg', '.jpeg', '.bmp', '.tiff')
+
+    if extension == ".pdf":
+        return extraire_texte_pdf(chemin_fichier)
+    elif extension == ".docx":
+        return executer_dans_pool(extraire_texte_docx, chemin_fichier), False, []
+    elif extension in [".xlsx", ".xls"]:
+        return executer_dans_pool(extraire_texte_excel, chemin_fichier), False, []
+    # MODIFIÉ : On ajoute une condition pour traiter les fichiers images
+    elif extension in extensions_images:
+        return extraire_texte_image_ocr(chemin_fichier)
+    return "", False, []
 
+def extraire_texte_fichier_avec_cache(chemin_fichier):
+    """Comme extraire_texte_fichier, mais réutilise le texte déjà extrait d'un fichier identique."""
+    cache = load_cache_extraction()
+    cle = cache.cle(chemin_fichier)
+    resultat = cache.lire(cle)
+    if resultat is not None:
+        return (*resultat, [])
+    texte, ocr_utilise, erreurs = extraire_texte_fichier(chemin_fichier)
+    # Un texte vide ou incomplet peut venir d'un échec passager (OCR...) : on ne le garde pas,
+    # sinon les pages manquantes ne seraient jamais relues
+    if texte and not erreurs:
+        cache.ecrire(cle, texte, ocr_utilise)
+    return texte, ocr_utilise, erreurs
 
 # --- Fonctions de Traitement et d'Indexation (INCHANGÉES) ---
 
+def initialiser_collections(client):
+    """
+    Crée les collections Weaviate si besoin. L'index est persistant et partagé entre les appels d'offres.
+    Chaque paragraphe porte un vecteur nommé par modèle du registre (clé de MODELES, suffixée par la dimension si réduite).
+    """
+    noms_vecteurs = list(dict.fromkeys([*MODELES, NOM_VECTEUR]))
+    config_index = config_index_hnsw(COMPRESSION_VECTEURS, HNSW_EF, HNSW_EF_CONSTRUCTION, HNSW_MAX_CONNECTIONS, RESCORE_LIMIT)
+    if client.collections.exists(CLASS_NAME):
+        config = client.collections.get(CLASS_NAME).config.get()
+        if "tender_ref" not in {p.name for p in config.properties} or not config.vector_config:
+            # Ancien schéma (mono-dossier, ou vecteur unique sans nom) : les fichiers extraits restent en cache,
+            # la réindexation d'un dossier ne refait donc que la vectorisation
+            client.collections.delete(CLASS_NAME)
+            client.collections.delete(DOSSIERS_CLASS_NAME)
+        else:
+            assurer_vecteurs_nommes(client.collections.get(CLASS_NAME), noms_vecteurs, config_index)
+            regler_ef(client.collections.get(CLASS_NAME), NOM_VECTEUR, HNSW_EF)
+    if not client.collections.exists(CLASS_NAME):
+        client.collections.create(
+            name=CLASS_NAME,
+            properties=[
+                wvc.Property(name="content", data_type=wvc.DataType.TEXT),
+                wvc.Property(name="source", data_type=wvc.DataType.TEXT),
+                wvc.Property(name="tender_ref", data_type=wvc.DataType.TEXT, tokenization=wvc.Tokenization.FIELD)
+            ],
+            vectorizer_config=[
+                wvc.Configure.NamedVectors.none(name=nom, vector_index_config=config_index) for nom in noms_vecteurs
+            ]
+        )
+    if not client.collections.exists(DOSSIERS_CLASS_NAME):
+        client.collections.create(
+            name=DOSSIERS_CLASS_NAME,
+            properties=[
+                wvc.Property(name="tender_ref", data_type=wvc.DataType.TEXT, tokenization=wvc.Tokenization.FIELD),
+                wvc.Property(name="nb_paragraphes", data_type=wvc.DataType.INT),
+                wvc.Property(name="date_indexation", data_type=wvc.DataType.DATE),
+                # Vecteurs nommés (modèles, éventuellement réduits) présents pour ce dossier
+                wvc.Property(name="modeles", data_type=wvc.DataType.TEXT_ARRAY)
+            ],
+            vectorizer_config=wvc.Configure.Vectorizer.none()
+        )
+
+def lire_marqueur_dossier(client, tender_ref):
+    """Propriétés du marqueur de l'appel d'offres (lecture par UUID déterministe), ou None s'il n'est pas indexé."""
+    if not client.collections.exists(DOSSIERS_CLASS_NAME):
+        return None
+    marqueur = client.collections.get(DOSSIERS_CLASS_NAME).query.fetch_object_by_id(generate_uuid5(tender_ref))
+    return marqueur.properties if marqueur is not None else None
+
+def modeles_du_dossier(client, tender_ref, marqueur=None):
+    """
+    Vecteurs nommés présents pour l'appel d'offres (lecture par UUID déterministe, en une seule requête).
+    Retourne None si l'appel d'offres n'est pas indexé.
+    """
+    marqueur = marqueur if marqueur is not None else lire_marqueur_dossier(client, tender_ref)
+    if marqueur is None:
+        return None
+    return set(marqueur.get("modeles") or [])
+
+def supprimer_index_dossier(client, tender_ref):
+    """Supprime les paragraphes et le marqueur d'un appel d'offres (réindexation ou traitement interrompu)."""
+    filtre = wq.Filter.by_property("tender_ref").equal(tender_ref)
+    client.collections.get(CLASS_NAME).data.delete_many(where=filtre)
+    dossiers = client.collections.get(DOSSIERS_CLASS_NAME)
+    if dossiers.data.exists(generate_uuid5(tender_ref)):
+        dossiers.data.delete_by_id(generate_uuid5(tender_ref))
+
+def marquer_dossier_indexe(client, tender_ref, nb_paragraphes):
+    """Enregistre l'appel d'offres comme indexé, une fois tous ses fichiers traités."""
+    client.collections.get(DOSSIERS_CLASS_NAME).data.insert(
+        properties={
+            "tender_ref": tender_ref,
+            "nb_paragraphes": nb_paragraphes,
+            "date_indexation": datetime.now(timezone.utc),
+            "modeles": [NOM_VECTEUR]
+        },
+        uuid=generate_uuid5(tender_ref)
+    )
+
+def compresser_index_si_pret(client):
+    """Active la compression PQ/SQ du vecteur actif dès que l'index contient assez de paragraphes pour l'apprendre."""
+    doc_collection = client.collections.get(CLASS_NAME)
+    nb_paragraphes = doc_collection.aggregate.over_all(total_count=True).total_count
+    return activer_compression(
+        doc_collection, NOM_VECTEUR, COMPRESSION_VECTEURS, nb_paragraphes, TAILLE_ENTRAINEMENT_COMPRESSION, RESCORE_LIMIT
+    )
+
+def compter_paragraphes(client, tender_ref):
+    """Nombre de paragraphes indexés pour un appel d'offres."""
+    if not client.collections.exists(CLASS_NAME):
+        return 0
+    doc_collection = client.collections.get(CLASS_NAME)
+    response = doc_collection.aggregate.over_all(
+        filters=wq.Filter.by_property("tender_ref").equal(tender_ref), total_count=True
+    )
+    return response.total_count
+
 # Intérêt du code : Met à jour la fonction principale de traitement pour qu'elle gère aussi les images.
-def traiter_fichier(client, chemin_fichier, model, progress_queue):
+# MODIFIÉ : Étape 1 du pipeline : extraction et découpage uniquement, les paragraphes sont ensuite
+# déposés dans `file_paragraphes` pour l'étape de vectorisation (consommer_paragraphes)
+def extraire_fichier(chemin_fichier, progress_queue):
+    """
+    Étape 1 du pipeline : extraction du texte d'un fichier.
+    Retourne (texte, ocr_utilise, erreurs) ; le texte est None si l'extraction a échoué,
+    et `erreurs` n'est pas vide si le texte est incomplet.
+    """
     nom_fichier = os.path.basename(chemin_fichier)
     try:
-        ocr_utilise = False
-        extension = os.path.splitext(chemin_fichier)[1].lower()
-        texte = ""
         progress_queue.put((nom_fichier, 5, "Extraction du texte..."))
+        # MODIFIÉ : Les fichiers déjà extraits (même contenu) sont relus depuis le cache
+        texte, ocr_utilise, erreurs = extraire_texte_fichier_avec_cache(chemin_fichier)
 
-        # MODIFIÉ : On définit une liste d'extensions d'images reconnues
-        extensions_images = ('.png', '.jpg', '.jpeg', '.bmp', '.tiff')
-
-        if extension == ".pdf":
-            texte, ocr_utilise = extraire_texte_pdf(chemin_fichier)
-        elif extension == ".docx":
-            texte = extraire_texte_docx(chemin_fichier)
-        elif extension in [".xlsx", ".xls"]:
-            texte = extraire_texte_excel(chemin_fichier)
-        # MODIFIÉ : On ajoute une condition pour traiter les fichiers images
-        elif extension in extensions_images:
-            # On appelle la nouvelle fonction pour extraire le texte des images
-            texte, ocr_utilise = extraire_texte_image_ocr(chemin_fichier)
-        
         if not texte:
+            if erreurs:
+                progress_queue.put((nom_fichier, -1, "; ".join(erreurs)))
+                return None, ocr_utilise, erreurs
             progress_queue.put((nom_fichier, 100, "Fichier vide ou illisible"))
-            return 0, ocr_utilise
+            return texte, ocr_utilise, erreurs
+
+        progress_queue.put((nom_fichier, 8, "Texte extrait"))
+        return texte, ocr_utilise, erreurs
+
+    except Exception as e:
+        progress_queue.put((nom_fichier, -1, str(e)))
+        return None, False, [str(e)]
 
-        # Le reste de la fonction ne change pas...
-        paragraphes = decouper_texte(texte)
+def decouper_fichier(nom_fichier, texte, progress_queue, file_paragraphes, compteur_dossier):
+    """Découpe un fichier extrait, une fois sa décision finale dans `compteur_dossier`, et l'envoie au consommateur."""
+    try:
+        # MODIFIÉ : Les lignes répétées d'une page à l'autre et d'un fichier à l'autre du dossier sont retirées
+        paragraphes = decouper_texte(texte, compteur_dossier=compteur_dossier, nom_fichier=nom_fichier)
         if not paragraphes:
             progress_queue.put((nom_fichier, 100, "Aucun paragraphe trouvé"))
-            return 0, ocr_utilise
-
-        total_paragraphes = len(paragraphes)
-        batch_size = 32
-        doc_collection = client.collections.get(CLASS_NAME)
-
-        for i in range(0, total_paragraphes, batch_size):
-            batch_paragraphes = paragraphes[i:i + batch_size]
-            batch_embeddings = model.encode(batch_paragraphes, show_progress_bar=False)
-            objects_to_insert = [
-                weaviate.classes.data.DataObject(properties={"content": p, "source": nom_fichier}, vector=emb.tolist())
-                for p, emb in zip(batch_paragraphes, batch_embeddings)
-            ]
-            if objects_to_insert:
-                doc_collection.data.insert_many(objects_to_insert)
+            return
+        progress_queue.put((nom_fichier, 10, f"En attente de vectorisation ({len(paragraphes)} paragraphes)..."))
+        file_paragraphes.put((nom_fichier, paragraphes))
+    except Exception as e:
+        progress_queue.put((nom_fichier, -1, str(e)))
 
-            progress_percentage = 10 + int(((i + len(batch_paragraphes)) / total_paragraphes) * 85)
-            progress_queue.put((nom_fichier, progress_percentage, f"Traitement... {i + len(batch_paragraphes)}/{total_paragraphes}"))
+def consommer_paragraphes(client, model, file_paragraphes, progress_queue, tender_ref, totaux, statistiques):
+    """
+    Étape 2 du pipeline : unique consommateur qui vectorise des lots de paragraphes mélangeant plusieurs fichiers,
+    puis les insère dans Weaviate. S'arrête à la réception de None. Remplit `totaux` (fichier -> nb de paragraphes)
+    et `statistiques` (nombre de lots, de paragraphes, de doublons ignorés, durée cumulée de vectorisation
+    et paragraphes que Weaviate a refusés malgré les nouvelles tentatives, par fichier).
+    """
+    doc_collection = client.collections.get(CLASS_NAME)
+    restants = {}
+    echecs = set()
+    # Empreintes des paragraphes déjà pris en charge pour ce dossier : un paragraphe identique
+    # (clause type reprise dans le CPS et le RC...) n'est ni revectorisé ni réinséré
+    deja_vus = set()
+    batcher = MicroBatcher(TAILLE_LOT_EMBEDDING, DELAI_MAX_LOT)
+    prefixe = MODELES[MODELE_EMBEDDING]["prefixe_passage"]
+    reduction = load_reduction()
+    # MODIFIÉ : Encodage par buckets de longueur en tokens (moins de padding), ordre d'origine restitué
+    encodeur = EncodeurParBuckets(model)
+    statistiques.update(lots=0, paragraphes=0, doublons=0, duree_encodage=0.0)
+    fin = False
+    with ouvrir_lot(doc_collection, MODE_LOT_WEAVIATE, TAILLE_LOT_WEAVIATE, REQUETES_CONCURRENTES_WEAVIATE) as lot_weaviate:
+        while not fin or len(batcher):
+            # On attend d'autres fichiers tant que le lot n'est ni plein ni arrivé à son délai maximal
+            while not fin and not batcher.pret():
+                try:
+                    element = file_paragraphes.get(timeout=batcher.temps_restant())
+                except queue.Empty:
+                    break
+                if element is None:
+                    fin = True
+                    break
+                nom_fichier, paragraphes = element
+                nouveaux = []
+                for p in paragraphes:
+                    empreinte = hashlib.blake2b(normaliser_texte(p).lower().encode("utf-8"), digest_size=16).digest()
+                    if empreinte not in deja_vus:
+                        deja_vus.add(empreinte)
+                        nouveaux.append(p)
+                statistiques["doublons"] += len(paragraphes) - len(nouveaux)
+                if not nouveaux:
+                    totaux[nom_fichier] = 0
+                    progress_queue.put((nom_fichier, 100, f"✅ Terminé ({len(paragraphes)} paragraphes déjà présents dans le dossier)"))
+                    continue
+                totaux[nom_fichier] = restants[nom_fichier] = len(nouveaux)
+                batcher.ajouter([(nom_fichier, p) for p in nouveaux])
+            if not len(batcher):
+                continue
 
-        progress_queue.put((nom_fichier, 100, f"✅ Terminé ({total_paragraphes} paragraphes)"))
-        return total_paragraphes, ocr_utilise
+            lot = batcher.extraire_lot()
+            try:
+                debut = time.perf_counter()
+                # MODIFIÉ : Le cache évite de réencoder les paragraphes types (CPS, RC, BPU) déjà vus
+                embeddings = load_cache_embeddings().encoder(encodeur, [prefixe + p for _, p in lot], show_progress_bar=False)
+                # Le cache garde les vecteurs pleine dimension : seule la copie envoyée à Weaviate est réduite
+                if reduction is not None:
+                    embeddings = reduction.projeter(embeddings)
+                statistiques["duree_encodage"] += time.perf_counter() - debut
+                statistiques["lots"] += 1
+                statistiques["paragraphes"] += len(lot)
+                # MODIFIÉ : Ajout au batch du client, qui envoie les objets en parallèle pendant la suite de la vectorisation.
+                # L'UUID déterministe rend les nouvelles tentatives sans risque de doublon
+                for (nom_fichier, p), emb in zip(lot, embeddings):
+                    lot_weaviate.add_object(
+                        properties={"content": p, "source": nom_fichier, "tender_ref": tender_ref},
+                        vector={NOM_VECTEUR: emb.tolist()},
+                        uuid=generate_uuid5(f"{tender_ref}|{nom_fichier}|{p}")
+                    )
+            except Exception as e:
+                # Les fichiers de ce lot sont marqués en erreur et leurs paragraphes restants abandonnés
+                for nom_fichier in {n for n, _ in lot} - echecs:
+                    echecs.add(nom_fichier)
+                    totaux.pop(nom_fichier, None)
+                    progress_queue.put((nom_fichier, -1, str(e)))
+                batcher.retirer(lambda element: element[0] in echecs)
+                continue
+            finally:
+                statistiques.update(encodeur.statistiques())
 
-    except Exception as e:
-        progress_queue.put((nom_fichier, -1, str(e)))
-        return 0, False
+            for nom_fichier, _ in lot:
+                restants[nom_fichier] -= 1
+            for nom_fichier in {n for n, _ in lot}:
+                faits = totaux[nom_fichier] - restants[nom_fichier]
+                if restants[nom_fichier] == 0:
+                    progress_queue.put((nom_fichier, 100, f"✅ Terminé ({totaux[nom_fichier]} paragraphes)"))
+                else:
+                    progress_percentage = 10 + int((faits / totaux[nom_fichier]) * 85)
+                    progress_queue.put((nom_fichier, progress_percentage, f"Traitement... {faits}/{totaux[nom_fichier]}"))
+
+    # Les objets refusés par Weaviate sont renvoyés, puis les échecs restants sont décomptés par fichier
+    echecs_insertion = reinserer_echecs(
+        doc_collection, list(doc_collection.batch.failed_objects), TENTATIVES_INSERTION,
+        MODE_LOT_WEAVIATE, TAILLE_LOT_WEAVIATE, REQUETES_CONCURRENTES_WEAVIATE
+    )
+    statistiques["echecs_insertion"] = resumer_echecs(echecs_insertion)
+    for nom_fichier, resume in statistiques["echecs_insertion"].items():
+        if nom_fichier in totaux:
+            totaux[nom_fichier] -= resume["nb"]
 
 def convertir_vers_docx(dossier_path):
     extensions = (".doc", ".rtf")
@@ -251,70 +653,208 @@ def convertir_vers_docx(dossier_path):
     if not fichiers_a_convertir:
         st.info("Aucun fichier .doc ou .rtf à convertir.")
         return
+    try:
+        pool = load_pool_libreoffice()
+    except Exception as e:
+        st.error(f"❌ Impossible de démarrer LibreOffice. Assurez-vous qu'il est installé et dans le PATH. Erreur : {e}")
+        return
+    if pool.mode_serveur:
+        st.caption(f"⚡ Conversion sur {pool.nb_instances} instance(s) LibreOffice déjà démarrée(s) (unoserver).")
+    else:
+        st.warning(
+            "⚠️ unoserver n'est pas installé : chaque fichier est converti par un LibreOffice démarré à froid (plus lent). "
+            "Installez-le (pip install unoserver) pour garder des instances prêtes."
+        )
     placeholder = st.empty()
+    placeholder.info(f"🔄 Conversion de {len(fichiers_a_convertir)} fichier(s) avec LibreOffice...")
     fichiers_convertis = 0
-    for nom_fichier in fichiers_a_convertir:
-        chemin_original = os.path.join(dossier_path, nom_fichier)
-        placeholder.info(f"🔄 Conversion de {nom_fichier} avec LibreOffice...")
-        try:
-            commande = [
-                "soffice", "--headless", "--convert-to", "docx", "--outdir", dossier_path, chemin_original
-            ]
-            result = subprocess.run(commande, check=True, capture_output=True, timeout=120)
+    # MODIFIÉ : Les fichiers sont convertis en parallèle sur des instances LibreOffice déjà démarrées
+    chemins = [os.path.join(dossier_path, nom_fichier) for nom_fichier in fichiers_a_convertir]
+    for chemin_original, erreur in pool.convertir_tous(chemins, dossier_path, TIMEOUT_CONVERSION):
+        nom_fichier = os.path.basename(chemin_original)
+        if erreur is None:
             os.remove(chemin_original)
             fichiers_convertis += 1
-        except FileNotFoundError:
+            placeholder.info(f"🔄 {fichiers_convertis}/{len(fichiers_a_convertir)} fichier(s) converti(s)...")
+        elif isinstance(erreur, FileNotFoundError):
             st.error("❌ Commande 'soffice' introuvable. Assurez-vous que LibreOffice est installé et dans le PATH.")
-            return
-        except subprocess.CalledProcessError as e:
-            st.warning(f"⚠️ La conversion de '{nom_fichier}' a échoué. Erreur : {e.stderr.decode()}")
-        except Exception as e:
-            st.warning(f"⚠️ Une erreur est survenue lors de la conversion de '{nom_fichier}': {e}")
+            break
+        elif isinstance(erreur, subprocess.CalledProcessError):
+            st.warning(f"⚠️ La conversion de '{nom_fichier}' a échoué. Erreur : {erreur.stderr.decode(errors='replace')}")
+        elif isinstance(erreur, subprocess.TimeoutExpired):
+            st.warning(f"⚠️ La conversion de '{nom_fichier}' a dépassé {TIMEOUT_CONVERSION} s et a été abandonnée.")
+        else:
+            st.warning(f"⚠️ Une erreur est survenue lors de la conversion de '{nom_fichier}': {erreur}")
     placeholder.empty()
     if fichiers_convertis > 0:
         st.success(f"{fichiers_convertis} fichier(s) ont été convertis en .docx.")
 
 
-def extraire_et_aplatir_zip(zip_file_object, destination_folder):
+def telecharger_fichier(url, chemin_destination, headers=None, tentatives=5, timeout=60):
+    """
+    Télécharge `url` en flux vers `chemin_destination`, par blocs (mémoire constante).
+    En cas d'échec, la tentative suivante reprend là où la précédente s'est arrêtée (en-tête HTTP Range).
+    """
+    for tentative in range(1, tentatives + 1):
+        deja_recu = os.path.getsize(chemin_destination) if os.path.exists(chemin_destination) else 0
+        entetes = dict(headers or {})
+        if deja_recu:
+            entetes["Range"] = f"bytes={deja_recu}-"
+        try:
+            with requests.get(url, headers=entetes, stream=True, timeout=timeout) as response:
+                if deja_recu and response.status_code == 416:
+                    # Plage non satisfaisable : le fichier a déjà été entièrement reçu
+                    return chemin_destination
+                response.raise_for_status()
+                # Si le serveur ignore l'en-tête Range (réponse 200), on repart de zéro
+                mode = "ab" if deja_recu and response.status_code == 206 else "wb"
+                with open(chemin_destination, mode) as f:
+                    for bloc in response.iter_content(chunk_size=TAILLE_BLOC_TELECHARGEMENT):
+                        f.write(bloc)
+            return chemin_destination
+        except requests.exceptions.RequestException:
+            if tentative == tentatives:
+                raise
+            time.sleep(2 * tentative)
+
+
+def nom_unique(file_name, registre_noms):
+    """Choisit un nom libre ("nom (1).ext", "nom (2).ext"...) à partir du registre en mémoire, sans sonder le disque."""
+    utilises, prochains_indices = registre_noms
+    cle = file_name.lower()
+    if cle not in utilises:
+        utilises.add(cle)
+        return file_name
+    name, ext = os.path.splitext(file_name)
+    counter = prochains_indices.get(cle, 1)
+    while f"{name} ({counter}){ext}".lower() in utilises:
+        counter += 1
+    prochains_indices[cle] = counter + 1
+    candidat = f"{name} ({counter}){ext}"
+    utilises.add(candidat.lower())
+    return candidat
+
+
+def copier_avec_limite(source, target, compteurs):
+    """Copie par blocs en comptant les octets réellement décompressés (la taille déclarée dans le ZIP peut mentir)."""
+    for bloc in iter(lambda: source.read(TAILLE_BLOC_TELECHARGEMENT), b""):
+        compteurs["octets"] += len(bloc)
+        if compteurs["octets"] > TAILLE_MAX_DECOMPRESSEE_ZIP:
+            raise ValueError("Archive refusée : taille décompressée maximale dépassée (zip bomb ?)")
+        target.write(bloc)
+
+
+def extraire_et_aplatir_zip(zip_file_object, destination_folder, registre_noms=None, compteurs=None, profondeur=0):
+    # MODIFIÉ : Registre des noms et compteurs partagés entre l'archive principale et les archives imbriquées
+    if registre_noms is None:
+        registre_noms = ({f.lower() for f in os.listdir(destination_folder)}, {})
+    if compteurs is None:
+        compteurs = {"fichiers": 0, "octets": 0}
+    if profondeur > PROFONDEUR_MAX_ZIP:
+        raise ValueError(f"Archive refusée : plus de {PROFONDEUR_MAX_ZIP} niveaux de ZIP imbriqués")
+
     for member in zip_file_object.infolist():
         if member.is_dir():
             continue
         file_name = os.path.basename(member.filename)
         if not file_name:
             continue
-        target_path = os.path.join(destination_folder, file_name)
-        counter = 1
-        original_target_path = target_path
-        while os.path.exists(target_path):
-            name, ext = os.path.splitext(original_target_path)
-            target_path = f"{name} ({counter}){ext}"
-            counter += 1
-        source = zip_file_object.open(member)
-        if member.filename.lower().endswith('.zip'):
-            nested_zip_data = io.BytesIO(source.read())
-            with zipfile.ZipFile(nested_zip_data, 'r') as nested_zip_ref:
-                extraire_et_aplatir_zip(nested_zip_ref, destination_folder)
-        else:
-            with open(target_path, "wb") as target:
-                shutil.copyfileobj(source, target)
+        compteurs["fichiers"] += 1
+        if compteurs["fichiers"] > NB_MAX_FICHIERS_ZIP:
+            raise ValueError(f"Archive refusée : plus de {NB_MAX_FICHIERS_ZIP} fichiers")
+        if compteurs["octets"] + member.file_size > TAILLE_MAX_DECOMPRESSEE_ZIP:
+            raise ValueError("Archive refusée : taille décompressée maximale dépassée (zip bomb ?)")
+
+        with zip_file_object.open(member) as source:
+            if member.filename.lower().endswith('.zip'):
+                # MODIFIÉ : L'archive imbriquée passe par un fichier temporaire (sur disque au-delà de TAILLE_SPOOL_ZIP)
+                with tempfile.SpooledTemporaryFile(max_size=TAILLE_SPOOL_ZIP) as nested_zip_data:
+                    copier_avec_limite(source, nested_zip_data, compteurs)
+                    nested_zip_data.seek(0)
+                    with zipfile.ZipFile(nested_zip_data, 'r') as nested_zip_ref:
+                        extraire_et_aplatir_zip(nested_zip_ref, destination_folder, registre_noms, compteurs, profondeur + 1)
+            else:
+                target_path = os.path.join(destination_folder, nom_unique(file_name, registre_noms))
+                with open(target_path, "wb") as target:
+                    copier_avec_limite(source, target, compteurs)
 
 
-def process_files_threaded(client, model, fichiers_paths):
+def process_files_threaded(client, model, fichiers_paths, tender_ref):
     st.subheader("📊 Progression du Traitement des Fichiers")
     progress_queue = queue.Queue()
-    total_paragraphes_total = 0
+    # MODIFIÉ : Pipeline en deux étapes : extraction en parallèle -> file de paragraphes -> un seul consommateur
+    file_paragraphes = queue.Queue()
+    totaux = {}
+    statistiques = {}
+    compteur_dossier = CompteurRepetitionsDossier([os.path.basename(p) for p in fichiers_paths])
     progress_placeholders = {
         os.path.basename(p): (st.text(f"⏳ En attente: {os.path.basename(p)}"), st.progress(0))
         for p in fichiers_paths
     }
-    with concurrent.futures.ThreadPoolExecutor() as executor:
+    # Fichiers en erreur (extraction, découpage ou lot abandonné par le consommateur) -> message
+    erreurs_fichiers = {}
+
+    def consommer():
+        # L'état du consommateur est remonté : s'il s'arrête sur une exception, le dossier est incomplet
+        try:
+            consommer_paragraphes(client, model, file_paragraphes, progress_queue, tender_ref, totaux, statistiques)
+            statistiques["consommateur_ok"] = True
+        except Exception as e:
+            statistiques["consommateur_ok"] = False
+            statistiques["erreur_consommateur"] = str(e)
+
+    consommateur = threading.Thread(target=consommer, daemon=True)
+    consommateur.start()
+    # Les threads ne font qu'orchestrer : le travail CPU d'extraction est fait dans le pool de processus
+    with concurrent.futures.ThreadPoolExecutor(max_workers=NB_PROCESSUS_EXTRACTION) as executor:
+        # Soumis par ordre de nom : les premiers fichiers, qui gardent les lignes communes, sont extraits d'abord
         futures = {
-            executor.submit(traiter_fichier, client, path, model, progress_queue): os.path.basename(path)
-            for path in fichiers_paths
+            executor.submit(extraire_fichier, path, progress_queue): os.path.basename(path)
+            for path in sorted(fichiers_paths, key=os.path.basename)
         }
+        a_recuperer = set(futures)
+        textes_en_attente = {}
+
+        def avancer_decoupage():
+            """
+            Enregistre les fichiers extraits et envoie au consommateur ceux dont les lignes communes au dossier sont
+            connues, sans attendre les autres extractions. Retourne True une fois la fin signalée au consommateur.
+            """
+            termines = [f for f in a_recuperer if f.done()]
+            if not termines and a_recuperer:
+                return False
+            for future in termines:
+                a_recuperer.discard(future)
+                nom_fichier = futures[future]
+                texte, ocr_utilise, erreurs = future.result()
+                if ocr_utilise:
+                    st.session_state.ocr_files.add(nom_fichier)
+                if texte and erreurs:
+                    # Texte partiel : il est indexé, mais le fichier compte comme une erreur (dossier non marqué indexé)
+                    erreurs_fichiers[nom_fichier] = "; ".join(erreurs)
+                    st.warning(f"Texte incomplet pour '{nom_fichier}' : {erreurs_fichiers[nom_fichier]}")
+                # Un fichier vide ou en erreur est aussi enregistré : il n'est plus attendu
+                compteur_dossier.enregistrer(nom_fichier, texte or "")
+                if texte:
+                    textes_en_attente[nom_fichier] = texte
+                    if not compteur_dossier.decision_finale(nom_fichier):
+                        progress_queue.put((nom_fichier, 8, "Texte extrait, en attente d'autres fichiers du dossier (lignes communes)..."))
+            for nom_fichier in sorted(textes_en_attente):
+                if compteur_dossier.decision_finale(nom_fichier):
+                    decouper_fichier(nom_fichier, textes_en_attente.pop(nom_fichier), progress_queue, file_paragraphes, compteur_dossier)
+            if a_recuperer:
+                return False
+            # Toutes les extractions sont enregistrées (plus aucun fichier en attente) : le consommateur
+            # peut s'arrêter une fois la file vidée
+            file_paragraphes.put(None)
+            return True
+
+        fin_signalee = False
         tasks_done = 0
         total_tasks = len(fichiers_paths)
         while tasks_done < total_tasks:
+            if not fin_signalee:
+                fin_signalee = avancer_decoupage()
             try:
                 nom_fichier, progress, message = progress_queue.get(timeout=0.1)
                 status_text, progress_bar = progress_placeholders[nom_fichier]
@@ -322,6 +862,7 @@ def process_files_threaded(client, model, fichiers_paths):
                     status_text.error(f"❌ Erreur sur {nom_fichier}")
                     st.error(f"Détail de l'erreur pour '{nom_fichier}': {message}")
                     progress_bar.empty()
+                    erreurs_fichiers[nom_fichier] = message
                     tasks_done += 1
                 else:
                     status_text.text(f"{nom_fichier}: {message}")
@@ -329,53 +870,74 @@ def process_files_threaded(client, model, fichiers_paths):
                     if progress == 100:
                         tasks_done += 1
             except queue.Empty:
+                if fin_signalee and not consommateur.is_alive():
+                    break
                 continue
-        for future in futures:
-            try:
-                nb_paras, ocr_utilise = future.result()
-                if ocr_utilise:
-                    st.session_state.ocr_files.add(futures[future])
-                total_paragraphes_total += nb_paras
-            except Exception:
-                pass
-    return total_paragraphes_total
+        if not fin_signalee:
+            concurrent.futures.wait(futures)
+            avancer_decoupage()
+    consommateur.join()
+    # Erreurs signalées après la sortie de la boucle de progression (consommateur arrêté entre-temps)
+    while not progress_queue.empty():
+        nom_fichier, progress, message = progress_queue.get()
+        if progress < 0 and nom_fichier not in erreurs_fichiers:
+            erreurs_fichiers[nom_fichier] = message
+            st.error(f"Détail de l'erreur pour '{nom_fichier}': {message}")
+    statistiques["lignes_retirees"] = compteur_dossier.lignes_retirees
+    return sum(totaux.values()), statistiques, erreurs_fichiers
 
 # MODIFIÉ : La fonction utilise maintenant le lien de téléchargement direct
-def telecharger_et_indexer_dossier(lien_dossier, client, model):
+# MODIFIÉ : L'index est persistant, seul l'appel d'offres "tender_ref" est (ré)indexé
+def telecharger_et_indexer_dossier(lien_dossier, client, model, tender_ref, forcer=False):
+    initialiser_collections(client)
+    modeles_presents = modeles_du_dossier(client, tender_ref)
+    if not forcer and modeles_presents is not None:
+        if NOM_VECTEUR in modeles_presents:
+            st.success("✅ Ce dossier est déjà indexé, il est directement disponible pour la recherche.")
+            return
+        # Dossier indexé avec un autre modèle : seul le vecteur du modèle actif est calculé, à partir du texte stocké
+        with st.status("🔁 Revectorisation avec le modèle actif...", expanded=True) as status:
+            try:
+                total = reindexer(
+                    client, MODELE_EMBEDDING, model, load_cache_embeddings(), tender_ref,
+                    class_name=CLASS_NAME, dossiers_class_name=DOSSIERS_CLASS_NAME,
+                    progression=lambda n: status.update(label=f"🔁 {n} paragraphes revectorisés..."), reduction=load_reduction(),
+                    vector_index_config=config_index_hnsw(
+                        COMPRESSION_VECTEURS, HNSW_EF, HNSW_EF_CONSTRUCTION, HNSW_MAX_CONNECTIONS, RESCORE_LIMIT
+                    )
+                )
+                status.update(label=f"🎉 {total} paragraphes revectorisés avec {NOM_DU_MODELE_DE_VECTEUR}.", state="complete")
+            except Exception as e:
+                status.update(label=f"❌ Erreur critique : {e}", state="error")
+        return
+    dossier_fichiers = dossier_local(tender_ref)
     with st.status("🚀 Démarrage du processus...", expanded=True) as status:
         try:
-            status.update(label="🧹 Nettoyage de la base de données et des anciens fichiers...")
-            if client.collections.exists(CLASS_NAME): client.collections.delete(CLASS_NAME)
-            client.collections.create(
-                name=CLASS_NAME,
-                properties=[
-                    wvc.Property(name="content", data_type=wvc.DataType.TEXT),
-                    wvc.Property(name="source", data_type=wvc.DataType.TEXT)
-                ],
-                vectorizer_config=wvc.Configure.Vectorizer.none()
-            )
-            if os.path.exists(FILES_DIRECTORY): shutil.rmtree(FILES_DIRECTORY)
-            os.makedirs(FILES_DIRECTORY)
-            time.sleep(1)
+            status.update(label="🧹 Nettoyage des anciens paragraphes et fichiers de ce dossier...")
+            supprimer_index_dossier(client, tender_ref)
+            if os.path.exists(dossier_fichiers): shutil.rmtree(dossier_fichiers)
+            os.makedirs(dossier_fichiers)
 
             status.update(label="📥 Téléchargement du dossier...")
-            # MODIFIÉ : Utilise directement le lien du dossier sans le générer
-            response = requests.get(lien_dossier, headers={"User-Agent": "Mozilla/5.0"}, timeout=60)
-            response.raise_for_status()
+            # MODIFIÉ : L'archive est écrite sur disque en flux (et reprise en cas de coupure) au lieu d'être gardée en mémoire
+            chemin_zip = FILES_DIRECTORY / f"{dossier_fichiers.name}.zip"
+            if os.path.exists(chemin_zip): os.remove(chemin_zip)
+            telecharger_fichier(lien_dossier, chemin_zip, headers={"User-Agent": "Mozilla/5.0"})
             
             status.update(label="📦 Décompression intelligente des fichiers...")
-            with zipfile.ZipFile(io.BytesIO(response.content), 'r') as zip_ref:
-                extraire_et_aplatir_zip(zip_ref, FILES_DIRECTORY)
+            with zipfile.ZipFile(chemin_zip, 'r') as zip_ref:
+                extraire_et_aplatir_zip(zip_ref, dossier_fichiers)
+            os.remove(chemin_zip)
             
             with st.expander("🔄 Fichiers .doc en cours de conversion", expanded=True):
-                convertir_vers_docx(FILES_DIRECTORY)
+                convertir_vers_docx(dossier_fichiers)
                 if st.session_state.get('conversion_files'):
                     st.success(f"{len(st.session_state.conversion_files)} fichier(s) converti(s) en .docx.")
             
             extensions_valides = (".pdf", ".docx", ".xlsx", ".xls", ".png", ".jpg", ".jpeg", ".bmp", ".tiff")
-            all_files_in_dir = os.listdir(FILES_DIRECTORY)
+            all_files_in_dir = os.listdir(dossier_fichiers)
             fichiers_a_traiter_paths = [
-                os.path.join(FILES_DIRECTORY, f) 
+                os.path.join(dossier_fichiers, f) 
                 for f in all_files_in_dir 
                 if f.lower().endswith(extensions_valides) and not f.startswith('~$')
             ]
@@ -386,13 +948,70 @@ def telecharger_et_indexer_dossier(lien_dossier, client, model):
                 st.rerun()
                 return
 
-            total_paragraphes = process_files_threaded(client, model, fichiers_a_traiter_paths)
+            load_cache_embeddings().reinitialiser_compteurs()
+            total_paragraphes, stats_vectorisation, erreurs_fichiers = process_files_threaded(
+                client, model, fichiers_a_traiter_paths, tender_ref
+            )
+            echecs_insertion = stats_vectorisation.get("echecs_insertion", {})
+            consommateur_ok = stats_vectorisation.get("consommateur_ok", False)
+            # MODIFIÉ : Le dossier n'est marqué comme indexé que si tous ses fichiers ont été entièrement indexés ;
+            # sinon le prochain traitement le reprendra entièrement
+            dossier_complet = consommateur_ok and not erreurs_fichiers and not echecs_insertion
+            if not consommateur_ok:
+                st.error(
+                    "❌ La vectorisation s'est interrompue : "
+                    f"{stats_vectorisation.get('erreur_consommateur', 'erreur inconnue')}. Relancez le traitement."
+                )
+            if erreurs_fichiers:
+                st.error(
+                    f"❌ {len(erreurs_fichiers)} fichier(s) n'ont pas pu être indexés : "
+                    "le dossier n'est pas marqué comme indexé. Relancez le traitement pour le compléter."
+                )
+                for nom_fichier, message in erreurs_fichiers.items():
+                    st.write(f"• {nom_fichier} : {message}")
+            if echecs_insertion:
+                st.error(
+                    f"❌ {sum(e['nb'] for e in echecs_insertion.values())} paragraphe(s) refusé(s) par Weaviate "
+                    f"après {TENTATIVES_INSERTION} nouvelles tentatives. Relancez le traitement pour compléter l'index."
+                )
+                for nom_fichier, echec in echecs_insertion.items():
+                    st.write(f"• {nom_fichier} : {echec['nb']} paragraphe(s) — {echec['message']}")
+            if dossier_complet:
+                marquer_dossier_indexe(client, tender_ref, total_paragraphes)
+                # Les fichiers bruts ne servent plus (le texte extrait est dans le cache d'extraction) : ils ne sont
+                # gardés qu'en cas d'erreur, pour relancer le traitement
+                shutil.rmtree(dossier_fichiers, ignore_errors=True)
+            if compresser_index_si_pret(client):
+                st.info(f"🗜️ Compression {COMPRESSION_VECTEURS.upper()} des vecteurs activée pour l'index.")
+
+            if stats_vectorisation.get("lots"):
+                st.caption(
+                    f"⚡ Vectorisation : {stats_vectorisation['paragraphes']} paragraphes en {stats_vectorisation['lots']} lot(s), "
+                    f"{stats_vectorisation['paragraphes'] / max(stats_vectorisation['duree_encodage'], 1e-9):.0f} paragraphes/s — "
+                    f"padding {stats_vectorisation['padding_sans_buckets']:.0%} sans les buckets (lot trié par longueur), "
+                    f"{stats_vectorisation['padding_buckets']:.0%} avec les buckets de longueur"
+                )
+            st.caption(
+                f"🧹 Avant vectorisation : {stats_vectorisation.get('lignes_retirees', 0)} ligne(s) répétée(s) retirée(s) "
+                f"(en-têtes, pieds de page, mentions communes aux fichiers), "
+                f"{stats_vectorisation.get('doublons', 0)} paragraphe(s) en double ignoré(s)"
+            )
+
+            stats_cache = load_cache_embeddings().statistiques()
+            st.caption(
+                f"🧠 Cache des vecteurs : {stats_cache['hits']} hit(s), {stats_cache['misses']} miss(es) "
+                f"({stats_cache['taux_hits']:.0%} de réussite, {stats_cache['entrees']} vecteurs en cache)"
+            )
             
             with st.expander("👁️ Fichiers PDF ayant nécessité une lecture OCR", expanded=True):
                 if st.session_state.get('ocr_files'):
                     for f in st.session_state.ocr_files: st.write(f"• {f}")
                 else: st.info("Aucun PDF n'a nécessité d'OCR.")
 
+            if not dossier_complet:
+                # Pas de rechargement de la page : le détail des échecs reste affiché
+                status.update(label=f"⚠️ Processus terminé avec des erreurs : {total_paragraphes} paragraphes indexés.", state="error")
+                return
             status.update(label=f"🎉 Processus terminé ! {total_paragraphes} paragraphes indexés.", state="complete")
             st.balloons()
             time.sleep(3)
@@ -402,7 +1021,7 @@ def telecharger_et_indexer_dossier(lien_dossier, client, model):
             status.update(label=f"❌ Erreur critique : {e}", state="error")
 
 
-def display_list_view(data, filter_options):
+def display_list_view(filter_options):
     st.markdown("""
     <style>
     .card:hover { box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1), 0 2px 4px -1px rgba(0, 0, 0, 0.06); }
@@ -415,32 +1034,30 @@ def display_list_view(data, filter_options):
     acheteur_filter = st.sidebar.multiselect("Filtrer par Acheteur", options=filter_options["acheteurs"])
     province_filter = st.sidebar.multiselect("Filtrer par Province", options=filter_options["provinces"])
     domaine_filter = st.sidebar.multiselect("Filtrer par Domaine", options=filter_options["domaines"])
+    cloture_filter = st.sidebar.selectbox(
+        "Date limite de remise des plis", [None, 3, 7, 30],
+        format_func=lambda j: "Toutes" if j is None else f"Clôture dans moins de {j} jours"
+    )
 
-    filtered_data = data
-    if keyword_filter:
-        kw = keyword_filter.lower()
-        # MODIFIÉ : La recherche par mot-clé se fait sur les nouveaux champs : _id, reference, objet
-        filtered_data = [item for item in filtered_data if kw in str(item.get("_id", "")).lower() or kw in item.get("reference", "").lower() or kw in item.get("objet", "").lower()]
-    if acheteur_filter: 
-        # MODIFIÉ : Le filtre utilise le champ "acheteur_public"
-        filtered_data = [item for item in filtered_data if item.get("acheteur_public") in acheteur_filter]
-    if province_filter: 
-        # MODIFIÉ : Le filtre utilise la liste de provinces que nous avons créée
-        filtered_data = [item for item in filtered_data if any(p in province_filter for p in item.get("provinces_list", []))]
-    if domaine_filter: 
-        # MODIFIÉ : Le filtre utilise le champ "domaine"
-        filtered_data = [item for item in filtered_data if item.get("domaine") in domaine_filter]
+    # MODIFIÉ : Les filtres (mot-clé sur _id, reference et objet, acheteur, province, domaine), le tri et la pagination
+    # sont faits par MongoDB : seule la page affichée est transférée
+    ITEMS_PER_PAGE = 10
+    filtres = (keyword_filter, tuple(acheteur_filter), tuple(province_filter), tuple(domaine_filter), cloture_filter)
+    if 'page' not in st.session_state: st.session_state.page = 1
+    try:
+        paginated_data, nb_resultats = load_page_consultations(*filtres, st.session_state.page, ITEMS_PER_PAGE)
+        total_pages = math.ceil(nb_resultats / ITEMS_PER_PAGE) if nb_resultats else 1
+        if st.session_state.page > total_pages:
+            st.session_state.page = 1
+            paginated_data, nb_resultats = load_page_consultations(*filtres, 1, ITEMS_PER_PAGE)
+    except Exception as e:
+        st.error(f"Erreur de connexion à MongoDB : {e}")
+        paginated_data, nb_resultats, total_pages = [], 0, 1
 
     st.title("📄 Appels d'Offres Publics")
-    st.write(f"**{len(filtered_data)}** résultat(s) trouvé(s)")
+    st.write(f"**{nb_resultats}** résultat(s) trouvé(s)")
     st.divider()
 
-    ITEMS_PER_PAGE = 10
-    total_pages = math.ceil(len(filtered_data) / ITEMS_PER_PAGE) if filtered_data else 1
-    if 'page' not in st.session_state or st.session_state.page > total_pages: st.session_state.page = 1
-    start_index = (st.session_state.page - 1) * ITEMS_PER_PAGE
-    paginated_data = filtered_data[start_index:start_index + ITEMS_PER_PAGE]
-
     for item in paginated_data:
         # MODIFIÉ : L'identifiant unique pour la clé est maintenant "_id"
         with st.container(border=True, key=str(item.get('_id'))):
@@ -449,7 +1066,7 @@ def display_list_view(data, filter_options):
                 # MODIFIÉ : Affiche "acheteur_public" et supprime l'abréviation qui n'existe plus
                 st.markdown(f'<h5>{item.get("acheteur_public", "N/A")}</h5>', unsafe_allow_html=True)
                 # MODIFIÉ : Utilise "date_publication" avec la fonction de formatage mise à jour
-                st.caption(f"Publié le : {format_date(item.get('date_publication'))}")
+                st.caption(f"Publié le : {format_date(item.get('date_publication_dt') or item.get('date_publication'))}")
             with col2: st.markdown('<div class="badge-en-cours">EN COURS</div>', unsafe_allow_html=True)
             st.divider()
             
@@ -464,8 +1081,8 @@ def display_list_view(data, filter_options):
                     <span>📋 {item.get("type_procedure", "N/A")}</span><br>
                     <span><strong>Référence :</strong> {item.get("reference", "N/A")}</span><br>
                     <span>📍 {', '.join(item.get("provinces_list", []))}</span><br>
-                    <span><strong>Date limite :</strong> {format_date(item.get("date_limite_remise_plis"))}</span><br>
-                    <strong style="color: #d9480f;">{jours_restants(item.get('date_limite_remise_plis'))}</strong>
+                    <span><strong>Date limite :</strong> {format_date(item.get("date_limite_remise_plis_dt") or item.get("date_limite_remise_plis"))}</span><br>
+                    <strong style="color: #d9480f;">{jours_restants(item.get("date_limite_remise_plis_dt") or item.get("date_limite_remise_plis"))}</strong>
                 </div>""", unsafe_allow_html=True)
             with col_boutons:
                 # MODIFIÉ : Le bouton de détails utilise le nouveau champ "lien_details"
@@ -476,7 +1093,8 @@ def display_list_view(data, filter_options):
                     # On sauvegarde un dictionnaire avec les DEUX liens
                     st.session_state.item_a_traiter = {
                         "details": item.get("lien_details"),
-                        "download": item.get("lien_dossier_direct")
+                        "download": item.get("lien_dossier_direct"),
+                        "tender_ref": calculer_tender_ref(item)
                     }
                     st.rerun()
     if total_pages > 1:
@@ -492,6 +1110,71 @@ def display_list_view(data, filter_options):
         _, col_text_total, _ = st.columns([3, 1, 3])
         col_text_total.markdown(f"<div style='text-align:center;'>sur {total_pages}</div>", unsafe_allow_html=True)
 
+def rechercher_paragraphes(client, model, requete, tender_ref, mode="hybride", alpha=ALPHA_HYBRIDE,
+                           reranker=None, nb_candidats=NB_CANDIDATS_RERANKING, limite=5, version_index=None):
+    """
+    Recherche dans les paragraphes d'un appel d'offres, en mode "hybride" (BM25 + vecteur) ou "vectorielle".
+    Avec un `reranker`, les `nb_candidats` premiers résultats sont reclassés par le cross-encoder.
+    Les résultats sont mis en cache avec `version_index` (état de l'index de l'appel d'offres) dans la clé :
+    ils sont recalculés dès que ses paragraphes changent.
+    Retourne (résultats, (nom du score, sens de lecture), durée de chaque étape en secondes).
+    """
+    cache_vecteurs, cache_resultats = load_caches_recherche()
+    # Les variantes triviales (espaces, formes Unicode) d'une même requête partagent les mêmes entrées
+    requete = normaliser_texte(requete)
+    cle_resultats = (requete, tender_ref, limite, mode, alpha if mode == "hybride" else None,
+                     NOM_DU_RERANKER if reranker is not None else None, nb_candidats, NOM_VECTEUR, version_index)
+    debut = time.perf_counter()
+    en_cache = cache_resultats.lire(cle_resultats)
+    if en_cache is not None:
+        resultats, libelle_score = en_cache
+        return resultats, libelle_score, {"cache des résultats": time.perf_counter() - debut}
+
+    durees = {}
+    vecteur_requete = cache_vecteurs.lire((NOM_VECTEUR, requete))
+    if vecteur_requete is None:
+        vecteur_requete = model.encode(MODELES[MODELE_EMBEDDING]["prefixe_requete"] + requete)
+        if load_reduction() is not None:
+            vecteur_requete = load_reduction().projeter(vecteur_requete)[0]
+        cache_vecteurs.ecrire((NOM_VECTEUR, requete), vecteur_requete)
+    durees["vectorisation de la requête"] = time.perf_counter() - debut
+
+    doc_collection = client.collections.get(CLASS_NAME)
+    filtre = wq.Filter.by_property("tender_ref").equal(tender_ref)
+    nb_resultats = max(nb_candidats, limite) if reranker is not None else limite
+    debut = time.perf_counter()
+    if mode == "hybride":
+        response = doc_collection.query.hybrid(
+            query=requete, vector=vecteur_requete.tolist(), target_vector=NOM_VECTEUR, alpha=alpha,
+            query_properties=["content"], limit=nb_resultats, filters=filtre,
+            return_metadata=wq.MetadataQuery(score=True)
+        )
+        libelle_score = ("score hybride", "plus c'est haut, mieux c'est")
+        score = lambda item: item.metadata.score
+    else:
+        response = doc_collection.query.near_vector(
+            near_vector=vecteur_requete.tolist(), target_vector=NOM_VECTEUR, limit=nb_resultats, filters=filtre,
+            return_metadata=wq.MetadataQuery(distance=True)
+        )
+        libelle_score = ("distance", "plus c'est bas, mieux c'est")
+        score = lambda item: item.metadata.distance
+    durees["recherche Weaviate"] = time.perf_counter() - debut
+    resultats = [
+        {"content": item.properties.get("content", ""), "source": item.properties.get("source", "Inconnue"), "score": score(item)}
+        for item in response.objects
+    ]
+
+    if reranker is not None and resultats:
+        debut = time.perf_counter()
+        scores = reranker.predict([(requete, r["content"]) for r in resultats])
+        for resultat, score_reranker in zip(resultats, scores):
+            resultat["score"] = float(score_reranker)
+        resultats.sort(key=lambda r: r["score"], reverse=True)
+        libelle_score = ("score du reranker", "plus c'est haut, mieux c'est")
+        durees["reclassement"] = time.perf_counter() - debut
+    cache_resultats.ecrire(cle_resultats, (resultats[:limite], libelle_score))
+    return resultats[:limite], libelle_score, durees
+
 def display_process_view(client, model):
     st.title("⚙️ Traitement et Indexation d'un Appel d'Offres")
     if st.button("⬅️ Retour à la liste"):
@@ -500,7 +1183,9 @@ def display_process_view(client, model):
         st.rerun()
     item_a_traiter = st.session_state.get("item_a_traiter", {})
     lien_details = item_a_traiter.get("details", "Lien non trouvé")
+    tender_ref = item_a_traiter.get("tender_ref", "")
     st.text_input("Lien du dossier à traiter :", value=lien_details, disabled=True)
+    forcer = st.checkbox("Forcer la réindexation (même si le dossier est déjà indexé)")
     
     if st.button("Lancer le Traitement", type="primary"):
         lien_download = item_a_traiter.get("download")
@@ -508,57 +1193,80 @@ def display_process_view(client, model):
             st.session_state.conversion_files = []
             st.session_state.ocr_files = set()
             # MODIFIÉ : Appel de la fonction avec le lien direct
-            telecharger_et_indexer_dossier(lien_download, client, model)
+            telecharger_et_indexer_dossier(lien_download, client, model, tender_ref, forcer)
         else: st.error("Aucun lien à traiter.")
             
     st.divider()
     st.header("📊 État de la base de données")
     col1, col2 = st.columns(2)
     fichiers_locaux = 0
-    if os.path.exists(FILES_DIRECTORY):
-        fichiers_locaux = len([f for f in os.listdir(FILES_DIRECTORY) if f.lower().endswith((".pdf", ".docx", ".xlsx", ".xls"))])
-    col1.metric(label="📄 Fichiers Locaux Prêts", value=fichiers_locaux)
+    dossier_fichiers = dossier_local(tender_ref)
+    if os.path.exists(dossier_fichiers):
+        fichiers_locaux = len([f for f in os.listdir(dossier_fichiers) if f.lower().endswith((".pdf", ".docx", ".xlsx", ".xls"))])
+    col1.metric(label="📄 Fichiers Locaux Prêts", value=fichiers_locaux,
+                help="Les fichiers téléchargés sont supprimés une fois le dossier entièrement indexé.")
     
-    total_paragraphs = 0
-    if client.collections.exists(CLASS_NAME):
-        doc_collection = client.collections.get(CLASS_NAME)
-        response = doc_collection.aggregate.over_all(total_count=True)
-        total_paragraphs = response.total_count
+    # MODIFIÉ : On ne compte que les paragraphes de cet appel d'offres
+    total_paragraphs = compter_paragraphes(client, tender_ref)
     col2.metric(label="✍️ Paragraphes dans Weaviate", value=total_paragraphs)
+    marqueur = lire_marqueur_dossier(client, tender_ref)
+    modeles_presents = modeles_du_dossier(client, tender_ref, marqueur)
+    # Change à chaque (ré)indexation ou revectorisation de l'appel d'offres : invalide les résultats en cache
+    version_index = (total_paragraphs, str((marqueur or {}).get("date_indexation")), tuple(sorted(modeles_presents or [])))
+    if modeles_presents is not None and NOM_VECTEUR not in modeles_presents:
+        st.info(
+            f"Ce dossier a été indexé avec un autre modèle ({', '.join(sorted(modeles_presents))}). "
+            "Lancez le traitement pour calculer les vecteurs du modèle actif, sans réextraire les documents."
+        )
     
     st.divider()
     st.header("🔎 Rechercher dans les documents")
     requete_utilisateur = st.text_input("Que cherchez-vous ?", "Fourniture de bureau")
+    # MODIFIÉ : Recherche hybride (mots-clés + sens) pour retrouver aussi les références, numéros d'articles et montants
+    col_mode, col_alpha, col_rerank = st.columns(3)
+    mode = col_mode.radio("Mode de recherche", ["hybride", "vectorielle"], horizontal=True,
+                          format_func=lambda m: "Hybride (mots-clés + sens)" if m == "hybride" else "Vectorielle (sens)")
+    alpha = col_alpha.slider("Alpha (0 = mots-clés, 1 = sens)", 0.0, 1.0, ALPHA_HYBRIDE, 0.05, disabled=(mode != "hybride"))
+    avec_reranker = col_rerank.checkbox(f"Reclasser les {NB_CANDIDATS_RERANKING} meilleurs candidats (cross-encoder)")
     if st.button("Lancer la recherche"):
         if requete_utilisateur and total_paragraphs > 0:
-            vecteur_requete = model.encode(requete_utilisateur).tolist()
-            doc_collection = client.collections.get(CLASS_NAME)
-            response = doc_collection.query.near_vector(near_vector=vecteur_requete, limit=5, return_metadata=wq.MetadataQuery(distance=True))
+            resultats, libelle_score, durees = rechercher_paragraphes(
+                client, model, requete_utilisateur, tender_ref, mode, alpha,
+                reranker=load_reranker() if avec_reranker else None, version_index=version_index
+            )
+            st.caption("⏱️ " + " — ".join(f"{etape} : {duree * 1000:.0f} ms" for etape, duree in durees.items())
+                       + f" — total : {sum(durees.values()) * 1000:.0f} ms")
             st.subheader("Résultats de la recherche :")
-            if not response.objects: st.warning("Aucun résultat trouvé.")
+            if not resultats: st.warning("Aucun résultat trouvé.")
             else:
-                for item in response.objects:
-                    st.info(f"**Pertinence (distance) :** {item.metadata.distance:.4f} (plus c'est bas, mieux c'est)")
-                    st.write(f"📄 **Source** : {item.properties.get('source', 'Inconnue')}")
-                    st.write(f"📌 **Paragraphe** : {item.properties.get('content', '')}")
+                for resultat in resultats:
+                    st.info(f"**Pertinence ({libelle_score[0]}) :** {resultat['score']:.4f} ({libelle_score[1]})")
+                    st.write(f"📄 **Source** : {resultat['source']}")
+                    st.write(f"📌 **Paragraphe** : {resultat['content']}")
                     st.divider()
         elif not requete_utilisateur: st.warning("Veuillez entrer une requête de recherche.")
         else: st.warning("La base de données est vide. Veuillez d'abord traiter un dossier.")
 
 # --- Exécution Principale ---
-if 'view' not in st.session_state: st.session_state.view = 'list'
-if 'page' not in st.session_state: st.session_state.page = 1
+# MODIFIÉ : Protégé par __main__ pour que les processus d'OCR (démarrés en "spawn" sous Windows) ne relancent pas l'application
+if __name__ == "__main__":
+    if 'view' not in st.session_state: st.session_state.view = 'list'
+    if 'page' not in st.session_state: st.session_state.page = 1
 
-load_dotenv()
-data, filter_options = load_data_from_mongo()
-model = load_model()
-
-try:
-    with weaviate.connect_to_local(port=8080, grpc_port=50051) as client:
-        if st.session_state.view == 'list':
-            display_list_view(data, filter_options)
-        elif st.session_state.view == 'process':
-            display_process_view(client, model)
-except Exception as e:
-    st.error(f"Erreur critique de connexion à Weaviate : {e}")
-    st.info("Veuillez vous assurer que votre instance Weaviate est bien en cours d'exécution sur le port 8080.")
+    filter_options = load_filter_options()
+    model = load_model()
+    try:
+        load_reduction()
+    except FileNotFoundError as e:
+        st.error(f"Dimension réduite {DIMENSION_REDUITE} : {e}")
+        st.stop()
+
+    try:
+        with weaviate.connect_to_local(port=8080, grpc_port=50051) as client:
+            if st.session_state.view == 'list':
+                display_list_view(filter_options)
+            elif st.session_state.view == 'process':
+                display_process_view(client, model)
+    except Exception as e:
+        st.error(f"Erreur critique de connexion à Weaviate : {e}")
+        st.info("Veuillez vous assurer que votre instance Weaviate est bien en cours d'exécution sur le port 8080.")
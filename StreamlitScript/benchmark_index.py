@@ -0,0 +1,119 @@
+"""
+Benchmark des réglages de l'index vectoriel (compression, efConstruction, maxConnections, ef) sur les vecteurs
+déjà indexés : rappel@k par rapport à une recherche exacte, latence des requêtes et mémoire estimée.
+Chaque réglage est importé dans une collection temporaire, supprimée à la fin.
+    python benchmark_index.py --vecteur bge_base_en [--nb-vecteurs 20000] [--k 10]
+"""
+import argparse
+import time
+import uuid
+
+import numpy as np
+import weaviate
+import weaviate.classes.config as wvc
+from weaviate.classes.data import DataObject
+
+from index_vectoriel import COMPRESSIONS, config_index_hnsw, activer_compression, regler_ef, octets_par_vecteur
+from reduction_dimension import charger_vecteurs_indexes, normaliser, top_k, rappel_a_k
+
+COLLECTION_BENCHMARK = "BenchmarkIndexVectoriel"
+GRAPHES = ((64, 16), (128, 32), (256, 64))  # (efConstruction, maxConnections)
+VALEURS_EF = (32, 64, 128, 256)
+
+
+def importer(collection, corpus, taille_lot=1000):
+    for debut in range(0, len(corpus), taille_lot):
+        reponse = collection.data.insert_many([
+            DataObject(properties={}, uuid=uuid.UUID(int=debut + i), vector={"v": vecteur.tolist()})
+            for i, vecteur in enumerate(corpus[debut:debut + taille_lot])
+        ])
+        if reponse.has_errors:
+            raise RuntimeError(f"Import du benchmark : {next(iter(reponse.errors.values())).message}")
+
+
+def attendre_index(collection, compression_activee, delai_max=300):
+    """
+    Attend que l'index soit complet avant les mesures : Weaviate indexe et compresse en arrière-plan, les shards
+    ne sont READY avec une file de vectorisation vide qu'une fois tous les vecteurs indexés (et compressés).
+    """
+    limite = time.monotonic() + delai_max
+    while time.monotonic() < limite:
+        quantizer_pret = not compression_activee or collection.config.get().vector_config["v"].vector_index_config.quantizer is not None
+        if quantizer_pret and all(
+            shard.status == "READY" and not shard.vector_queue_size for shard in collection.config.get_shards()
+        ):
+            return
+        time.sleep(1)
+    raise TimeoutError("L'index n'a pas été construit (ou compressé) à temps")
+
+
+def mesurer(collection, requetes, verite, k):
+    resultats, latences = [], []
+    for requete in requetes:
+        debut = time.perf_counter()
+        reponse = collection.query.near_vector(near_vector=requete.tolist(), target_vector="v", limit=k, return_properties=[])
+        latences.append(time.perf_counter() - debut)
+        resultats.append({obj.uuid.int for obj in reponse.objects})
+    return rappel_a_k(verite, resultats), 1000 * np.percentile(latences, 50), 1000 * np.percentile(latences, 95)
+
+
+def benchmark(client, corpus, requetes, k, compressions, graphes=GRAPHES, valeurs_ef=VALEURS_EF):
+    dimension = corpus.shape[1]
+    segments = dimension // 4
+    verite = top_k(requetes, corpus, k)
+    lignes = []
+    for compression in compressions:
+        for ef_construction, max_connections in graphes:
+            if client.collections.exists(COLLECTION_BENCHMARK):
+                client.collections.delete(COLLECTION_BENCHMARK)
+            collection = client.collections.create(
+                name=COLLECTION_BENCHMARK,
+                vectorizer_config=[wvc.Configure.NamedVectors.none(
+                    name="v", vector_index_config=config_index_hnsw(compression, -1, ef_construction, max_connections)
+                )]
+            )
+            debut = time.perf_counter()
+            importer(collection, corpus)
+            compression_activee = activer_compression(
+                collection, "v", compression, len(corpus), taille_entrainement=len(corpus), segments=segments
+            )
+            attendre_index(collection, compression_activee)
+            duree_import = time.perf_counter() - debut
+            for ef in valeurs_ef:
+                regler_ef(collection, "v", ef)
+                rappel, p50, p95 = mesurer(collection, requetes, verite, k)
+                lignes.append({
+                    "compression": compression, "ef_construction": ef_construction, "max_connections": max_connections,
+                    "ef": ef, "rappel": rappel, "p50_ms": p50, "p95_ms": p95, "import_s": duree_import,
+                    # Formule (vecteur compressé + graphe HNSW), pas une mesure de la mémoire du serveur
+                    "octets_estimes": octets_par_vecteur(compression, dimension, max_connections, segments)
+                })
+    client.collections.delete(COLLECTION_BENCHMARK)
+    return lignes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark des réglages HNSW et de la compression des vecteurs.")
+    parser.add_argument("--vecteur", default="bge_base_en", help="Vecteur nommé de DocumentParagraph à utiliser")
+    parser.add_argument("--nb-vecteurs", type=int, default=20_000)
+    parser.add_argument("--nb-requetes", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--compressions", nargs="+", choices=COMPRESSIONS, default=list(COMPRESSIONS))
+    args = parser.parse_args()
+
+    with weaviate.connect_to_local(port=8080, grpc_port=50051) as client:
+        vecteurs = normaliser(charger_vecteurs_indexes(client, args.vecteur, args.nb_vecteurs))
+        if len(vecteurs) <= args.nb_requetes + args.k:
+            raise SystemExit(f"Pas assez de vecteurs '{args.vecteur}' indexés ({len(vecteurs)}) : indexez d'abord des dossiers.")
+        # Requêtes tirées des paragraphes puis retirées du corpus
+        melange = np.random.default_rng(0).permutation(len(vecteurs))
+        requetes, corpus = vecteurs[melange[:args.nb_requetes]], vecteurs[melange[args.nb_requetes:]]
+        lignes = benchmark(client, corpus, requetes, args.k, args.compressions)
+
+    print(f"Vecteur '{args.vecteur}' : {len(corpus)} paragraphes, {len(requetes)} requêtes, dimension {corpus.shape[1]}")
+    print(f"{'compression':<11} {'efC':>4} {'maxC':>5} {'ef':>4} {'rappel@' + str(args.k):>10} {'p50 ms':>7} {'p95 ms':>7} "
+          f"{'import s':>9} {'octets/vecteur estimés':>23}")
+    for l in lignes:
+        print(f"{l['compression']:<11} {l['ef_construction']:>4} {l['max_connections']:>5} {l['ef']:>4} {l['rappel']:>10.3f} "
+              f"{l['p50_ms']:>7.2f} {l['p95_ms']:>7.2f} {l['import_s']:>9.1f} {l['octets_estimes']:>23}")
+    print("Octets par vecteur : estimation d'après la configuration (compression, maxConnections), non mesurée.")
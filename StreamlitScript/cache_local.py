@@ -0,0 +1,210 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normaliser_texte(texte):
+    """Normalise un paragraphe (Unicode NFKC + espaces) pour que les variantes triviales partagent la même clé."""
+    return " ".join(unicodedata.normalize("NFKC", texte).split())
+
+
+class CacheEmbeddings:
+    """
+    Cache persistant (SQLite) des vecteurs de paragraphes.
+    La clé est le SHA-256 du nom du modèle + du texte normalisé, la valeur un vecteur float32.
+    Les entrées les moins récemment utilisées sont supprimées au-delà de `taille_max`.
+    """
+
+    def __init__(self, chemin_db, nom_modele, taille_max=500_000):
+        os.makedirs(os.path.dirname(chemin_db), exist_ok=True)
+        self.nom_modele = nom_modele
+        self.taille_max = taille_max
+        self.hits = 0
+        self.misses = 0
+        # La connexion est partagée entre les threads de traitement, protégée par un verrou
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(chemin_db, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (cle TEXT PRIMARY KEY, vecteur BLOB NOT NULL, dernier_acces REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_acces ON embeddings (dernier_acces)")
+        self._conn.commit()
+        self._nb_entrees = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _cle(self, texte):
+        return hashlib.sha256(f"{self.nom_modele}\0{normaliser_texte(texte)}".encode("utf-8")).hexdigest()
+
+    def encoder(self, model, textes, **kwargs):
+        """Remplace `model.encode(textes)` : seuls les paragraphes absents du cache sont envoyés au modèle."""
+        if not textes:
+            return np.empty((0, 0), dtype=np.float32)
+        cles = [self._cle(t) for t in textes]
+        trouves = self._lire(set(cles))
+
+        # Les doublons au sein du même lot ne sont encodés qu'une fois
+        a_encoder = {}
+        for cle, texte in zip(cles, textes):
+            if cle not in trouves and cle not in a_encoder:
+                a_encoder[cle] = texte
+        nb_hits = sum(1 for cle in cles if cle in trouves)
+        with self._lock:
+            self.hits += nb_hits
+            self.misses += len(cles) - nb_hits
+
+        if a_encoder:
+            nouveaux = np.asarray(model.encode(list(a_encoder.values()), **kwargs), dtype=np.float32)
+            nouveaux_par_cle = dict(zip(a_encoder.keys(), nouveaux))
+            self._ecrire(nouveaux_par_cle)
+            trouves.update(nouveaux_par_cle)
+        return np.stack([trouves[cle] for cle in cles])
+
+    def _lire(self, cles):
+        trouves = {}
+        liste_cles = list(cles)
+        maintenant = time.time()
+        with self._lock:
+            # SQLite limite le nombre de paramètres par requête : on interroge par tranches
+            for i in range(0, len(liste_cles), 500):
+                tranche = liste_cles[i:i + 500]
+                marqueurs = ",".join("?" * len(tranche))
+                lignes = self._conn.execute(
+                    f"SELECT cle, vecteur FROM embeddings WHERE cle IN ({marqueurs})", tranche
+                ).fetchall()
+                for cle, blob in lignes:
+                    trouves[cle] = np.frombuffer(blob, dtype=np.float32)
+            if trouves:
+                self._conn.executemany(
+                    "UPDATE embeddings SET dernier_acces = ? WHERE cle = ?", [(maintenant, c) for c in trouves]
+                )
+                self._conn.commit()
+        return trouves
+
+    def _ecrire(self, vecteurs_par_cle):
+        maintenant = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (cle, vecteur, dernier_acces) VALUES (?, ?, ?)",
+                [(cle, vecteur.tobytes(), maintenant) for cle, vecteur in vecteurs_par_cle.items()]
+            )
+            self._nb_entrees += len(vecteurs_par_cle)
+            if self._nb_entrees > self.taille_max:
+                # Éviction LRU : on supprime les entrées les plus anciennement utilisées
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE cle IN (SELECT cle FROM embeddings ORDER BY dernier_acces LIMIT ?)",
+                    (self._nb_entrees - self.taille_max,)
+                )
+                self._nb_entrees = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._conn.commit()
+
+    def reinitialiser_compteurs(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def statistiques(self):
+        """Retourne les compteurs hits/misses et le taux de réussite du cache."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "taux_hits": self.hits / total if total else 0.0,
+                "entrees": self._nb_entrees
+            }
+
+
+class CacheLRU:
+    """
+    Cache en mémoire, borné à `taille_max` entrées : la moins récemment utilisée est retirée en premier.
+    Partagé entre les sessions Streamlit, donc protégé par un verrou.
+    """
+
+    def __init__(self, taille_max=1000):
+        self.taille_max = taille_max
+        self.hits = 0
+        self.misses = 0
+        self._entrees = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lire(self, cle):
+        """Retourne la valeur associée à `cle`, ou None."""
+        with self._lock:
+            if cle not in self._entrees:
+                self.misses += 1
+                return None
+            self._entrees.move_to_end(cle)
+            self.hits += 1
+            return self._entrees[cle]
+
+    def ecrire(self, cle, valeur):
+        with self._lock:
+            self._entrees[cle] = valeur
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+
+    def statistiques(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "taux_hits": self.hits / total if total else 0.0,
+                "entrees": len(self._entrees)
+            }
+
+
+def empreinte_fichier(chemin_fichier, taille_bloc=1024 * 1024):
+    """SHA-256 du contenu d'un fichier, lu par blocs pour ne pas le charger entièrement en mémoire."""
+    sha = hashlib.sha256()
+    with open(chemin_fichier, "rb") as f:
+        for bloc in iter(lambda: f.read(taille_bloc), b""):
+            sha.update(bloc)
+    return sha.hexdigest()
+
+
+class CacheExtraction:
+    """
+    Cache persistant (SQLite) du texte extrait des fichiers, avec l'indicateur `ocr_utilise`.
+    La clé est l'empreinte du contenu du fichier : une même pièce jointe présente dans plusieurs
+    appels d'offres n'est extraite (et OCRisée) qu'une seule fois.
+    `version` doit être changée lorsque la logique d'extraction évolue, pour invalider les anciens textes.
+    """
+
+    def __init__(self, chemin_db, version="1"):
+        os.makedirs(os.path.dirname(chemin_db), exist_ok=True)
+        self.version = version
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(chemin_db, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS extractions (cle TEXT PRIMARY KEY, texte TEXT NOT NULL, ocr_utilise INTEGER NOT NULL, date_extraction REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def cle(self, chemin_fichier):
+        extension = os.path.splitext(chemin_fichier)[1].lower()
+        return f"{self.version}:{extension}:{empreinte_fichier(chemin_fichier)}"
+
+    def lire(self, cle):
+        """Retourne (texte, ocr_utilise) si le fichier a déjà été extrait, sinon None."""
+        with self._lock:
+            ligne = self._conn.execute("SELECT texte, ocr_utilise FROM extractions WHERE cle = ?", (cle,)).fetchone()
+        if ligne is None:
+            return None
+        return ligne[0], bool(ligne[1])
+
+    def ecrire(self, cle, texte, ocr_utilise):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions (cle, texte, ocr_utilise, date_extraction) VALUES (?, ?, ?, ?)",
+                (cle, texte, int(ocr_utilise), time.time())
+            )
+            self._conn.commit()
@@ -0,0 +1,134 @@
+"""
+Requêtes MongoDB de la liste des appels d'offres (marchespublics_db.consultations) : les filtres, le tri par date
+de publication et la pagination sont faits par le serveur, qui ne renvoie que les champs affichés de la page demandée.
+Gestion des index de la collection, et mise à niveau des documents importés par une ancienne version du scraper
+(faite aussi par l'application à la connexion) :
+    python consultations.py
+"""
+import os
+import re
+from datetime import datetime, timedelta
+
+import certifi
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT
+
+# Champs lus pour afficher une carte (et calculer le tender_ref)
+CHAMPS_AFFICHES = {
+    "acheteur_public": 1, "date_publication": 1, "objet": 1, "type_procedure": 1, "reference": 1,
+    "lieu_execution": 1, "date_limite_remise_plis": 1, "lien_details": 1, "lien_dossier_direct": 1,
+    "date_publication_dt": 1, "date_limite_remise_plis_dt": 1, "provinces": 1
+}
+TRI_LISTE = [("date_publication_dt", DESCENDING), ("_id", DESCENDING)]
+# Index de la collection (mêmes définitions que creer_index dans le scraper) : chaque filtre par égalité
+# est suivi du tri par date, pour que MongoDB filtre et trie par l'index
+INDEX_CONSULTATIONS = [
+    (TRI_LISTE, {}),
+    ([("acheteur_public", ASCENDING), ("date_publication_dt", DESCENDING)], {}),
+    ([("domaine", ASCENDING), ("date_publication_dt", DESCENDING)], {}),
+    ([("provinces", ASCENDING), ("date_publication_dt", DESCENDING)], {}),
+    ([("date_limite_remise_plis_dt", ASCENDING)], {}),
+    # Un seul index plein texte par collection : objet et référence, en français (racines, mots vides)
+    ([("objet", TEXT), ("reference", TEXT)], {"default_language": "french", "weights": {"reference": 5, "objet": 1}})
+]
+
+
+def provinces_de(item):
+    """Liste des provinces d'un appel d'offres ("lieu_execution" est une chaîne "A, B, C")."""
+    return [p.strip() for p in (item.get("lieu_execution") or "").split(",") if p.strip() and p.strip() != "-"]
+
+
+def construire_filtre(mot_cle="", acheteurs=(), provinces=(), domaines=(), cloture_dans_jours=None):
+    """
+    Filtre MongoDB équivalent aux filtres de la barre latérale (mot-clé sur _id, référence et objet).
+    `cloture_dans_jours` : seulement les consultations encore ouvertes dont la date limite tombe dans ce délai.
+    """
+    conditions = []
+    mot_cle = (mot_cle or "").strip()
+    if ObjectId.is_valid(mot_cle):
+        conditions.append({"_id": ObjectId(mot_cle)})
+    elif mot_cle:
+        # Recherche par l'index plein texte. Une référence ("AO 12/2025") est cherchée comme une expression,
+        # sinon ses nombres seraient des mots indépendants
+        expression = mot_cle.replace('"', " ")
+        recherche = f'"{expression}"' if re.search(r"\d", mot_cle) else mot_cle
+        conditions.append({"$text": {"$search": recherche, "$language": "french"}})
+    if acheteurs:
+        conditions.append({"acheteur_public": {"$in": list(acheteurs)}})
+    if provinces:
+        conditions.append({"provinces": {"$in": list(provinces)}})
+    if domaines:
+        conditions.append({"domaine": {"$in": list(domaines)}})
+    if cloture_dans_jours is not None:
+        # Dates stockées sans fuseau, à l'heure du Maroc (voir convertir_date dans le scraper)
+        maintenant = datetime.now()
+        conditions.append({"date_limite_remise_plis_dt": {
+            "$gte": maintenant, "$lte": maintenant + timedelta(days=cloture_dans_jours)
+        }})
+    if not conditions:
+        return {}
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def charger_page(collection, filtre, page, par_page):
+    """Appels d'offres de la page `page` (à partir de 1), du plus récent au plus ancien (tri par l'index des dates)."""
+    curseur = collection.find(filtre, CHAMPS_AFFICHES).sort(TRI_LISTE).skip((page - 1) * par_page).limit(par_page)
+    return list(curseur)
+
+
+def options_filtres(collection):
+    """Valeurs proposées dans les filtres, calculées par le serveur (valeurs distinctes)."""
+    return {
+        "acheteurs": sorted(a for a in collection.distinct("acheteur_public") if a),
+        "provinces": sorted(p for p in collection.distinct("provinces") if p),
+        "domaines": sorted(d for d in collection.distinct("domaine") if d)
+    }
+
+
+def assurer_index(collection):
+    """Crée les index manquants (create_index est sans effet sur un index identique déjà présent)."""
+    for cles, options in INDEX_CONSULTATIONS:
+        collection.create_index(cles, **options)
+
+
+def _date_depuis_chaine(champ, formats):
+    conversions = [{"$dateFromString": {"dateString": f"${champ}", "format": f, "onError": None, "onNull": None}}
+                   for f in formats]
+    return {"$ifNull": conversions + [None]}
+
+
+def mettre_a_niveau_documents(collection):
+    """
+    Ajoute aux documents importés avant la version actuelle du scraper les champs calculés à l'import
+    (dates au format BSON, liste des provinces), directement dans MongoDB. Retourne le nombre de documents modifiés.
+    """
+    provinces = {"$filter": {
+        "input": {"$map": {"input": {"$split": [{"$ifNull": ["$lieu_execution", ""]}, ","]},
+                           "in": {"$trim": {"input": "$$this"}}}},
+        "cond": {"$not": {"$in": ["$$this", ["", "-"]]}}
+    }}
+    resultat = collection.update_many(
+        {"$or": [{"provinces": {"$exists": False}}, {"date_publication_dt": {"$exists": False}},
+                 {"date_limite_remise_plis_dt": {"$exists": False}}]},
+        [{"$set": {
+            "provinces": provinces,
+            "date_publication_dt": _date_depuis_chaine("date_publication", ["%d/%m/%Y %H:%M", "%d/%m/%Y"]),
+            "date_limite_remise_plis_dt": _date_depuis_chaine("date_limite_remise_plis", ["%d/%m/%Y %H:%M", "%d/%m/%Y"])
+        }}]
+    )
+    return resultat.modified_count
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    if not os.getenv("MONGO2_URI"):
+        raise SystemExit("La variable d'environnement MONGO2_URI n'est pas définie !")
+    client = MongoClient(os.getenv("MONGO2_URI"), tls=True, tlsCAFile=certifi.where(), serverSelectionTimeoutMS=10000)
+    try:
+        collection = client.marchespublics_db.consultations
+        print(f"{mettre_a_niveau_documents(collection)} document(s) mis à niveau.")
+        assurer_index(collection)
+        print("Index : " + ", ".join(sorted(collection.index_information())))
+    finally:
+        client.close()
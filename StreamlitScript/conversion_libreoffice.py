@@ -0,0 +1,122 @@
+import concurrent.futures
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+
+class PoolLibreOffice:
+    """
+    Garde plusieurs instances LibreOffice prêtes (serveurs `unoserver`) et répartit les conversions
+    .doc/.rtf -> .docx entre elles via une file d'attente. Chaque instance a son propre profil utilisateur,
+    ce qui permet des conversions réellement simultanées.
+    Si `unoserver` n'est pas installé, repli sur des `soffice --headless` lancés en parallèle (un profil par instance).
+    """
+
+    def __init__(self, nb_instances=3, port_base=2003, timeout_demarrage=30):
+        self.nb_instances = nb_instances
+        self.port_base = port_base
+        self.timeout_demarrage = timeout_demarrage
+        self.mode_serveur = bool(shutil.which("unoserver") and shutil.which("unoconvert"))
+        self._dossier_profils = tempfile.mkdtemp(prefix="lo_profils_")
+        self._processus = {}
+        self._instances_libres = queue.Queue()
+        try:
+            for indice in range(nb_instances):
+                if self.mode_serveur:
+                    self._demarrer_instance(indice)
+                self._instances_libres.put(indice)
+        except Exception:
+            # Les instances déjà démarrées (et celle qui n'a pas démarré) sont arrêtées
+            self.arreter()
+            raise
+
+    def _profil(self, indice):
+        return Path(self._dossier_profils, f"instance_{indice}").as_uri()
+
+    def _ports(self, indice):
+        # Port XML-RPC de unoserver, et port UNO de l'instance LibreOffice associée
+        return self.port_base + 2 * indice, self.port_base + 2 * indice + 1
+
+    def _demarrer_instance(self, indice):
+        port, uno_port = self._ports(indice)
+        self._processus[indice] = subprocess.Popen(
+            ["unoserver", "--interface", "127.0.0.1", "--port", str(port), "--uno-port", str(uno_port),
+             "--user-installation", self._profil(indice)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        limite = time.monotonic() + self.timeout_demarrage
+        while time.monotonic() < limite:
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=1):
+                    return
+            except OSError:
+                if self._processus[indice].poll() is not None:
+                    break
+                time.sleep(0.5)
+        # Instance arrêtée : elle sera relancée à sa prochaine utilisation (voir _instance_arretee)
+        self._arreter_processus(indice)
+        raise RuntimeError(f"L'instance LibreOffice {indice} n'a pas démarré en {self.timeout_demarrage} s")
+
+    def _arreter_processus(self, indice):
+        processus = self._processus.get(indice)
+        if processus and processus.poll() is None:
+            processus.kill()
+            processus.wait()
+
+    def _redemarrer_instance(self, indice):
+        self._arreter_processus(indice)
+        self._demarrer_instance(indice)
+
+    def _instance_arretee(self, indice):
+        """Vrai si le serveur unoserver de l'instance s'est arrêté (plantage de LibreOffice...)."""
+        processus = self._processus.get(indice)
+        return processus is None or processus.poll() is not None
+
+    def convertir(self, chemin_fichier, dossier_sortie, timeout=120):
+        """Convertit un fichier en .docx sur la première instance libre. Lève une exception en cas d'échec."""
+        indice = self._instances_libres.get()
+        try:
+            if self.mode_serveur and self._instance_arretee(indice):
+                self._redemarrer_instance(indice)
+            if self.mode_serveur:
+                chemin_sortie = os.path.join(dossier_sortie, os.path.splitext(os.path.basename(chemin_fichier))[0] + ".docx")
+                commande = ["unoconvert", "--host", "127.0.0.1", "--port", str(self._ports(indice)[0]),
+                            "--convert-to", "docx", chemin_fichier, chemin_sortie]
+            else:
+                commande = ["soffice", f"-env:UserInstallation={self._profil(indice)}", "--headless",
+                            "--convert-to", "docx", "--outdir", dossier_sortie, chemin_fichier]
+            try:
+                subprocess.run(commande, check=True, capture_output=True, timeout=timeout)
+            except subprocess.TimeoutExpired:
+                # Une instance bloquée sur un fichier est relancée pour ne pas bloquer la suite de la file
+                if self.mode_serveur:
+                    self._redemarrer_instance(indice)
+                raise
+            except subprocess.CalledProcessError:
+                # Échec de unoconvert : si le serveur s'est arrêté, il est relancé pour les conversions suivantes
+                if self.mode_serveur and self._instance_arretee(indice):
+                    self._redemarrer_instance(indice)
+                raise
+        finally:
+            self._instances_libres.put(indice)
+
+    def convertir_tous(self, chemins_fichiers, dossier_sortie, timeout=120):
+        """Convertit les fichiers en parallèle sur les instances. Génère (chemin, exception ou None) au fil de l'eau."""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.nb_instances) as executor:
+            futures = {
+                executor.submit(self.convertir, chemin, dossier_sortie, timeout): chemin
+                for chemin in chemins_fichiers
+            }
+            for future in concurrent.futures.as_completed(futures):
+                yield futures[future], future.exception()
+
+    def arreter(self):
+        for processus in self._processus.values():
+            if processus.poll() is None:
+                processus.terminate()
+        shutil.rmtree(self._dossier_profils, ignore_errors=True)
@@ -0,0 +1,291 @@
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+# Taille cible d'un morceau indexé (en tokens du modèle, estimés) et reprise entre deux morceaux consécutifs
+TAILLE_MAX_TOKENS = 200
+CHEVAUCHEMENT_TOKENS = 40
+# Une ligne courte présente sur au moins cette part des pages d'un document paginé (pages séparées par "\f")
+# est un en-tête ou un pied de page. Une ligne répétée sur une même page (montants des lots...) reste du contenu
+RATIO_PAGES_ENTETE = 0.5
+LONGUEUR_MAX_ENTETE = 120
+# Une ligne présente dans au moins SEUIL_FICHIERS fichiers du même dossier n'est gardée que dans le premier
+SEUIL_FICHIERS = 3
+# Les morceaux plus courts sont ignorés (comme les lignes trop courtes auparavant)
+LONGUEUR_MIN_MORCEAU = 10
+# Titres gardés comme contexte en tête des morceaux d'une section ("CHAPITRE II — Article 5 : Objet")
+NB_MAX_TITRES_CONTEXTE = 2
+
+RE_MOT = re.compile(r"\w+|[^\w\s]")
+RE_TITRE = re.compile(
+    r"^(article|art\.|chapitre|titre|section|annexe|partie|lot)\s+(\d+|[IVXLC]+\b|premier|unique)", re.IGNORECASE
+)
+RE_TITRE_NUMEROTE = re.compile(r"^(\d+(\.\d+)*|[IVXLC]+)[.)-]?\s+[A-ZÀ-Ý]")
+RE_NUMERO_PAGE = re.compile(r"^(page\s*)?[-–—]?\s*\d+\s*((/|sur)\s*\d+)?\s*[-–—]?$", re.IGNORECASE)
+# Compteur de pages d'un en-tête ou pied de page : "page 3/12", "page 3 sur 12", ou "page 3" en début ou fin de ligne
+RE_COMPTEUR_PAGE = re.compile(r"\bpage\s*\d+\s*(/|sur)\s*\d+|^page\s*\d+\b|\bpage\s*\d+$", re.IGNORECASE)
+RE_FIN_PHRASE = re.compile(r"(?<=[.!?;])\s+")
+
+
+def estimer_tokens(texte):
+    """Estimation rapide du nombre de tokens (mots et ponctuation, +30 % pour le découpage en sous-mots)."""
+    return math.ceil(len(RE_MOT.findall(texte)) * 1.3)
+
+
+def signature_ligne(ligne):
+    """
+    Empreinte d'une ligne, insensible à la casse et au compteur de pages ("CPS - page 3/12" = "CPS - page 4/12").
+    Les autres nombres comptent : "Caution provisoire : 1000 DH" et "... : 2000 DH" sont deux lignes différentes.
+    """
+    cle = RE_COMPTEUR_PAGE.sub("page #", " ".join(ligne.lower().split()))
+    return hashlib.blake2b(cle.encode("utf-8"), digest_size=8).digest()
+
+
+def est_ligne_tableau(ligne):
+    return "\t" in ligne or " | " in ligne or len(re.findall(r"\S {3,}(?=\S)", ligne)) >= 2
+
+
+def est_titre(ligne):
+    if len(ligne) > 100 or ligne.endswith((".", ",", ";")):
+        return False
+    if RE_TITRE.match(ligne) or RE_TITRE_NUMEROTE.match(ligne):
+        return True
+    lettres = [c for c in ligne if c.isalpha()]
+    return len(lettres) >= 4 and ligne.isupper()
+
+
+def est_candidat_entete(ligne):
+    # Les titres d'articles ("Article 3 : Objet") ne diffèrent parfois que par leur numéro : ils ne sont jamais retirés
+    return bool(ligne) and len(ligne) <= LONGUEUR_MAX_ENTETE and not est_ligne_tableau(ligne) and not RE_TITRE.match(ligne)
+
+
+def decouper_pages(texte):
+    return [[l.strip() for l in page.split("\n")] for page in texte.split("\f")]
+
+
+def signatures_repetees(pages, ratio_pages=RATIO_PAGES_ENTETE):
+    """
+    Signatures des lignes présentes sur une grande partie des pages d'un document paginé (en-têtes, pieds de page).
+    Un document sans pages (docx, Excel) n'en a pas.
+    """
+    if len(pages) < 2:
+        return set()
+    nb_pages = Counter()
+    for page in pages:
+        nb_pages.update({signature_ligne(l) for l in page if est_candidat_entete(l)})
+    seuil_pages = max(2, math.ceil(ratio_pages * len(pages)))
+    return {s for s, n in nb_pages.items() if n >= seuil_pages}
+
+
+class CompteurRepetitionsDossier:
+    """
+    Lignes communes aux fichiers d'un même dossier (en-tête de l'acheteur, référence de l'appel d'offres...).
+    Une ligne présente dans SEUIL_FICHIERS fichiers est gardée dans le premier d'entre eux (par nom) et retirée
+    des autres. Les fichiers sont enregistrés au fil de leur extraction : un fichier peut être découpé dès que
+    le sort de chacune de ses lignes ne dépend plus des fichiers restant à extraire (voir decision_finale),
+    ce qui donne le même résultat, quel que soit l'ordre d'extraction, que si tout le dossier avait été attendu.
+    """
+
+    def __init__(self, noms_fichiers, seuil_fichiers=SEUIL_FICHIERS):
+        self.seuil_fichiers = seuil_fichiers
+        self.lignes_retirees = 0
+        self._restants = set(noms_fichiers)
+        self._fichiers_par_signature = defaultdict(set)
+        self._signatures_par_fichier = {}
+        self._lock = threading.Lock()
+
+    def enregistrer(self, nom_fichier, texte):
+        """Enregistre un fichier extrait (texte vide pour un fichier en erreur : il n'est plus attendu)."""
+        signatures = {signature_ligne(l) for page in decouper_pages(texte) for l in page if est_candidat_entete(l)}
+        with self._lock:
+            self._restants.discard(nom_fichier)
+            self._signatures_par_fichier[nom_fichier] = signatures
+            for signature in signatures:
+                self._fichiers_par_signature[signature].add(nom_fichier)
+
+    def _retiree(self, nom_fichier, signature):
+        fichiers = self._fichiers_par_signature[signature]
+        return len(fichiers) >= self.seuil_fichiers and min(fichiers) != nom_fichier
+
+    def _en_suspens(self, nom_fichier, signature):
+        fichiers = self._fichiers_par_signature[signature]
+        if self._retiree(nom_fichier, signature):
+            # Le nombre de fichiers ne peut que croître, et le premier fichier (par nom) ne peut que précéder
+            return False
+        if len(fichiers) + len(self._restants) < self.seuil_fichiers:
+            return False
+        # Gardée à coup sûr si ce fichier précède tous ceux qui ont la ligne ou qui restent à extraire
+        return min(fichiers | self._restants) != nom_fichier
+
+    def decision_finale(self, nom_fichier):
+        """Vrai si les fichiers restant à extraire ne peuvent plus changer les lignes retirées de ce fichier."""
+        with self._lock:
+            return not any(self._en_suspens(nom_fichier, s) for s in self._signatures_par_fichier[nom_fichier])
+
+    def signatures_a_retirer(self, nom_fichier):
+        with self._lock:
+            return {s for s in self._signatures_par_fichier.get(nom_fichier, ()) if self._retiree(nom_fichier, s)}
+
+    def compter_retraits(self, nb_lignes):
+        with self._lock:
+            self.lignes_retirees += nb_lignes
+
+
+def supprimer_entetes_repetes(pages, compteur_dossier=None, nom_fichier=None):
+    """
+    Retire les numéros de page et les lignes répétées (en-têtes, pieds de page, mentions communes aux fichiers du dossier).
+    Retourne les lignes restantes, toutes pages confondues.
+    """
+    a_retirer = signatures_repetees(pages)
+    if compteur_dossier is not None:
+        a_retirer |= compteur_dossier.signatures_a_retirer(nom_fichier)
+    lignes = [l for page in pages for l in page]
+    restantes = [
+        l for l in lignes
+        if not (l and RE_NUMERO_PAGE.match(l)) and not (est_candidat_entete(l) and signature_ligne(l) in a_retirer)
+    ]
+    if compteur_dossier is not None:
+        compteur_dossier.compter_retraits(sum(1 for l in lignes if l) - sum(1 for l in restantes if l))
+    return restantes
+
+
+def _blocs(lignes):
+    """
+    Regroupe les lignes en sections (titre, blocs). Un bloc est ("texte", paragraphe) ou ("tableau", lignes).
+    Les lignes d'un même paragraphe (coupé par la mise en page du PDF) sont recollées.
+    """
+    sections = []
+    titre, blocs, paragraphe, tableau, titres = "", [], [], [], []
+
+    def fermer_paragraphe():
+        if paragraphe:
+            blocs.append(("texte", " ".join(paragraphe)))
+            paragraphe.clear()
+
+    def fermer_tableau():
+        if tableau:
+            blocs.append(("tableau", list(tableau)))
+            tableau.clear()
+
+    def ouvrir_section():
+        # Titres consécutifs (ex : "CHAPITRE II" puis "Article 5 : Objet") : on garde les deux comme contexte.
+        # Une suite plus longue sans contenu (sommaire) est un bloc de texte ordinaire, seul le dernier titre est gardé
+        nonlocal titre, blocs
+        if not titres:
+            return
+        contexte = titres if len(titres) <= NB_MAX_TITRES_CONTEXTE else titres[-1:]
+        if len(titres) > NB_MAX_TITRES_CONTEXTE:
+            blocs.append(("texte", "\n".join(titres[:-1])))
+        if blocs:
+            sections.append((titre, blocs))
+        titre, blocs = " — ".join(contexte), []
+        titres.clear()
+
+    for brute in lignes:
+        if est_ligne_tableau(brute):
+            fermer_paragraphe()
+            ouvrir_section()
+            cellules = [c.strip() for c in re.split(r"\t| \| | {3,}", brute) if c.strip()]
+            tableau.append(" | ".join(cellules))
+            continue
+        ligne = " ".join(brute.split())
+        if not ligne:
+            fermer_paragraphe()
+            fermer_tableau()
+        elif est_titre(ligne):
+            fermer_paragraphe()
+            fermer_tableau()
+            titres.append(ligne)
+        else:
+            fermer_tableau()
+            ouvrir_section()
+            if paragraphe and paragraphe[-1].endswith("-") and ligne[:1].islower():
+                # Mot coupé en fin de ligne
+                paragraphe[-1] = paragraphe[-1][:-1] + ligne.split(" ", 1)[0]
+                ligne = ligne.split(" ", 1)[1] if " " in ligne else ""
+            if ligne:
+                paragraphe.append(ligne)
+    fermer_paragraphe()
+    fermer_tableau()
+    if titres:
+        # Titres en fin de document, sans contenu
+        blocs.append(("texte", "\n".join(titres)))
+    if blocs or titre:
+        sections.append((titre, blocs))
+    return sections
+
+
+def _unites_texte(paragraphe, budget, compter_tokens):
+    """Découpe un paragraphe en phrases ; une phrase plus longue que le budget est coupée entre deux mots."""
+    unites = []
+    for phrase in RE_FIN_PHRASE.split(paragraphe):
+        n = compter_tokens(phrase)
+        if n <= budget:
+            unites.append((phrase, n))
+            continue
+        mots = phrase.split()
+        taille = max(1, int(len(mots) * budget / n))
+        for i in range(0, len(mots), taille):
+            morceau = " ".join(mots[i:i + taille])
+            unites.append((morceau, compter_tokens(morceau)))
+    return unites
+
+
+def _empaqueter(unites, budget, chevauchement):
+    """Regroupe des unités consécutives en paquets d'au plus `budget` tokens, avec reprise des dernières unités."""
+    paquets, courant, n_courant = [], [], 0
+    for unite in unites:
+        if courant and n_courant + unite[1] > budget:
+            paquets.append([t for t, _ in courant])
+            reprise, n_reprise = [], 0
+            for precedente in reversed(courant):
+                if n_reprise + precedente[1] > chevauchement:
+                    break
+                reprise.insert(0, precedente)
+                n_reprise += precedente[1]
+            while reprise and n_reprise + unite[1] > budget:
+                n_reprise -= reprise.pop(0)[1]
+            courant, n_courant = reprise, n_reprise
+        courant.append(unite)
+        n_courant += unite[1]
+    if courant:
+        paquets.append([t for t, _ in courant])
+    return paquets
+
+
+def decouper_texte(texte, taille_max=TAILLE_MAX_TOKENS, chevauchement=CHEVAUCHEMENT_TOKENS, compter_tokens=estimer_tokens,
+                   compteur_dossier=None, nom_fichier=None):
+    """
+    Découpe le texte d'un document en morceaux d'au plus `taille_max` tokens qui suivent sa structure :
+    un morceau ne chevauche jamais deux sections (titres, "Article 12"...) et commence par le titre de sa section ;
+    les tableaux sont découpés entre deux lignes, en répétant leur ligne d'en-tête ;
+    les en-têtes et pieds de page répétés (et, avec `compteur_dossier` où le fichier est enregistré et sa
+    décision finale, les lignes communes aux fichiers du dossier) sont retirés au préalable.
+    """
+    lignes = supprimer_entetes_repetes(decouper_pages(texte), compteur_dossier, nom_fichier)
+    morceaux = []
+    for titre, blocs in _blocs(lignes):
+        prefixe = f"{titre}\n" if titre else ""
+        budget = max(taille_max - compter_tokens(titre), taille_max // 2)
+        unites = []
+
+        def vider_texte():
+            for paquet in _empaqueter(unites, budget, chevauchement):
+                morceaux.append(prefixe + " ".join(paquet))
+            unites.clear()
+
+        for nature, contenu in blocs:
+            if nature == "texte":
+                unites.extend(_unites_texte(contenu, budget, compter_tokens))
+                continue
+            vider_texte()
+            entete, lignes_tableau = contenu[0], contenu[1:]
+            budget_tableau = max(budget - compter_tokens(entete), 1)
+            for paquet in _empaqueter([(l, compter_tokens(l)) for l in lignes_tableau], budget_tableau, 0) or [[]]:
+                morceaux.append(prefixe + "\n".join([entete] + paquet))
+        vider_texte()
+        if not blocs and titre:
+            morceaux.append(titre)
+    return [m for m in morceaux if len(m.strip()) > LONGUEUR_MIN_MORCEAU]
@@ -0,0 +1,147 @@
+import math
+import os
+import tempfile
+
+import docx
+import pandas as pd
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+import pytesseract
+from PIL import Image
+from pdf2image import convert_from_path, pdfinfo_from_path
+from pypdf import PdfReader
+
+# Fonctions exécutées dans des processus séparés (ProcessPoolExecutor) : tout le travail CPU
+# d'extraction (lecture PDF, OCR, Word, Excel) se fait ici, hors du processus Streamlit.
+# Elles doivent rester dans un module importable, sans dépendance à Streamlit.
+
+# Nombre maximal de pages rendues à la fois par un processus
+TAILLE_FENETRE_PAGES = 4
+
+
+def initialiser_worker(tesseract_cmd):
+    """Exécuté au démarrage de chaque processus : reprend le chemin de Tesseract du processus principal."""
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    # Un seul thread OpenMP par Tesseract : le parallélisme vient des processus du pool,
+    # sinon chaque processus lance autant de threads que de cœurs et ils se concurrencent
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def compter_pages(chemin_fichier, poppler_path=None):
+    # Poppler (et non pypdf) : il faut pouvoir compter les pages des PDF que pypdf ne sait pas lire
+    return pdfinfo_from_path(chemin_fichier, poppler_path=poppler_path)["Pages"]
+
+
+def grouper_pages(pages, taille):
+    """Regroupe une liste de numéros de pages en fenêtres de pages consécutives d'au plus `taille` pages."""
+    fenetres = []
+    for numero_page in sorted(set(pages)):
+        if fenetres and numero_page == fenetres[-1][-1] + 1 and len(fenetres[-1]) < taille:
+            fenetres[-1].append(numero_page)
+        else:
+            fenetres.append([numero_page])
+    return fenetres
+
+
+def ocr_fenetre(chemin_fichier, premiere_page, derniere_page, poppler_path=None, lang='fra'):
+    """
+    OCRise les pages [premiere_page, derniere_page] du PDF. Retourne la liste des textes, dans l'ordre des pages.
+    Les pages sont rendues sur disque (et non en mémoire) puis chargées, OCRisées et libérées une par une :
+    la mémoire reste bornée quelle que soit la taille du document.
+    """
+    textes = []
+    with tempfile.TemporaryDirectory(prefix="ocr_") as dossier_tmp:
+        chemins_images = convert_from_path(
+            chemin_fichier, first_page=premiere_page, last_page=derniere_page, poppler_path=poppler_path,
+            output_folder=dossier_tmp, paths_only=True, fmt="png"
+        )
+        for chemin_image in chemins_images:
+            with Image.open(chemin_image) as img:
+                textes.append(pytesseract.image_to_string(img, lang=lang))
+            os.remove(chemin_image)
+    return textes
+
+
+def soumettre_ocr_pdf(executor, chemin_fichier, nb_processus, pages=None, poppler_path=None, lang='fra'):
+    """
+    Découpe les pages à OCRiser (toutes si `pages` est None) en fenêtres et les soumet au pool de processus.
+    Retourne la liste de (numeros_pages, future), dans l'ordre des pages.
+    """
+    if pages is None:
+        pages = range(1, compter_pages(chemin_fichier, poppler_path) + 1)
+    pages = list(pages)
+    # Fenêtres assez petites pour occuper tous les processus, sans dépasser TAILLE_FENETRE_PAGES
+    taille = max(1, min(TAILLE_FENETRE_PAGES, math.ceil(len(pages) / max(1, nb_processus))))
+    return [
+        (fenetre, executor.submit(ocr_fenetre, chemin_fichier, fenetre[0], fenetre[-1], poppler_path, lang))
+        for fenetre in grouper_pages(pages, taille)
+    ]
+
+
+def lire_pages_pdf(chemin_fichier, seuil_caracteres, poppler_path=None):
+    """
+    Lit la couche texte de chaque page du PDF.
+    Retourne (textes_pages, pages_a_ocr) : les pages dont le texte fait moins de `seuil_caracteres`
+    caractères (pages scannées) sont à OCRiser.
+    """
+    textes_pages = []
+    lecture_complete = True
+    try:
+        with open(chemin_fichier, "rb") as f:
+            reader = PdfReader(f)
+            for page in reader.pages:
+                textes_pages.append(page.extract_text() or "")
+    except Exception:
+        lecture_complete = False
+
+    pages_a_ocr = [i + 1 for i, contenu in enumerate(textes_pages) if len(contenu.strip()) < seuil_caracteres]
+    if not lecture_complete:
+        # pypdf s'est arrêté en cours de route : les pages restantes passent aussi à l'OCR
+        pages_a_ocr += list(range(len(textes_pages) + 1, compter_pages(chemin_fichier, poppler_path) + 1))
+    return textes_pages, pages_a_ocr
+
+
+def ocr_image(chemin_fichier, lang='fra'):
+    """Extrait le texte d'un fichier image avec Pytesseract."""
+    with Image.open(chemin_fichier) as img:
+        return pytesseract.image_to_string(img, lang=lang)
+
+
+def ligne_tableau(cellules):
+    """Une ligne de tableau par ligne de texte, cellules séparées par " | " (reconnu par le découpage)."""
+    valeurs = []
+    for cellule in cellules:
+        valeur = " ".join(str(cellule).split())
+        # Les cellules fusionnées sont répétées par python-docx
+        if valeur and (not valeurs or valeurs[-1] != valeur):
+            valeurs.append(valeur)
+    return " | ".join(valeurs)
+
+
+def extraire_texte_docx(chemin_fichier):
+    try:
+        document = docx.Document(chemin_fichier)
+        lignes = []
+        # Paragraphes et tableaux dans l'ordre du document (document.paragraphs ignore les tableaux)
+        for element in document.element.body.iterchildren():
+            if element.tag.endswith("}p"):
+                lignes.append(Paragraph(element, document).text)
+            elif element.tag.endswith("}tbl"):
+                lignes.append("")
+                lignes.extend(ligne_tableau(c.text for c in row.cells) for row in Table(element, document).rows)
+                lignes.append("")
+        # Les lignes vides séparent les paragraphes et les tableaux pour le découpage
+        return "\n".join(l if l.strip() else "" for l in lignes)
+    except Exception as e: raise Exception(f"Erreur DOCX: {e}")
+
+
+def extraire_texte_excel(chemin_fichier):
+    try:
+        df = pd.read_excel(chemin_fichier, sheet_name=None, header=None)
+        texte = ""
+        for sheet_name, sheet_df in df.items():
+            for ligne in sheet_df.itertuples(index=False):
+                texte += ligne_tableau(v for v in ligne if pd.notna(v)) + "\n"
+            texte += "\n"
+        return texte
+    except Exception as e: raise Exception(f"Erreur Excel: {e}")
@@ -0,0 +1,82 @@
+"""
+Réglages de l'index HNSW des vecteurs de paragraphes et compression des vecteurs en mémoire :
+  - "pq" : Product Quantization (un octet par segment) ;
+  - "bq" : Binary Quantization (un bit par dimension) ;
+  - "sq" : Scalar Quantization (un octet par dimension) ;
+  - "aucune" : vecteurs float32 en mémoire.
+Avec compression, les vecteurs d'origine restent sur disque et servent à re-classer (rescoring) les candidats.
+"""
+import weaviate.classes.config as wvc
+
+COMPRESSIONS = ("aucune", "pq", "bq", "sq")
+
+
+def _quantizer(compression, rescore_limit, taille_entrainement, segments=None, reconfigurer=False):
+    quantizer = (wvc.Reconfigure if reconfigurer else wvc.Configure).VectorIndex.Quantizer
+    if compression == "pq":
+        # Le rescoring PQ à partir des vecteurs sur disque est fait par Weaviate
+        return quantizer.pq(segments=segments, training_limit=taille_entrainement)
+    if compression == "bq":
+        return quantizer.bq(rescore_limit=rescore_limit)
+    if compression == "sq":
+        return quantizer.sq(rescore_limit=rescore_limit, training_limit=taille_entrainement)
+    return None
+
+
+def config_index_hnsw(compression="aucune", ef=-1, ef_construction=128, max_connections=32, rescore_limit=256):
+    """
+    Configuration HNSW à la création d'un vecteur nommé. `ef=-1` : ef dynamique (choisi par Weaviate selon la limite).
+    Seule la compression BQ, qui ne demande pas d'apprentissage, est activée dès la création :
+    PQ et SQ sont activées plus tard par `activer_compression`, une fois assez de vecteurs importés.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Compression inconnue : {compression} (valeurs possibles : {', '.join(COMPRESSIONS)})")
+    return wvc.Configure.VectorIndex.hnsw(
+        ef=ef,
+        ef_construction=ef_construction,
+        max_connections=max_connections,
+        quantizer=_quantizer(compression, rescore_limit, None) if compression == "bq" else None
+    )
+
+
+def activer_compression(collection, nom_vecteur, compression, nb_objets, taille_entrainement=100_000,
+                        rescore_limit=256, segments=None):
+    """
+    Active la compression PQ/SQ du vecteur nommé dès que la collection contient assez de vecteurs pour l'apprendre
+    (les centroïdes sont calculés sur les vecteurs déjà indexés). Retourne True si la compression vient d'être activée.
+    """
+    if compression not in ("pq", "sq") or nb_objets < taille_entrainement:
+        return False
+    config = collection.config.get().vector_config[nom_vecteur].vector_index_config
+    if getattr(config, "quantizer", None) is not None:
+        return False
+    collection.config.update(vectorizer_config=[
+        wvc.Reconfigure.NamedVectors.update(
+            name=nom_vecteur,
+            vector_index_config=wvc.Reconfigure.VectorIndex.hnsw(
+                quantizer=_quantizer(compression, rescore_limit, taille_entrainement, segments, reconfigurer=True)
+            )
+        )
+    ])
+    return True
+
+
+def regler_ef(collection, nom_vecteur, ef):
+    """Modifie ef (taille de la liste de candidats à la recherche), seul réglage HNSW modifiable après création."""
+    config = collection.config.get().vector_config[nom_vecteur].vector_index_config
+    if config.ef == ef:
+        return
+    collection.config.update(vectorizer_config=[
+        wvc.Reconfigure.NamedVectors.update(name=nom_vecteur, vector_index_config=wvc.Reconfigure.VectorIndex.hnsw(ef=ef))
+    ])
+
+
+def octets_par_vecteur(compression, dimension, max_connections, segments=None):
+    """Estimation de la mémoire par vecteur : vecteur (compressé ou non) + liens du graphe HNSW (couche 0)."""
+    tailles = {
+        "aucune": 4 * dimension,
+        "pq": segments or dimension // 4,
+        "bq": dimension // 8,
+        "sq": dimension
+    }
+    return tailles[compression] + 2 * max_connections * 8
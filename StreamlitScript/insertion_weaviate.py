@@ -0,0 +1,45 @@
+import time
+
+# Insertion des objets dans Weaviate par le batching côté client (requêtes gRPC envoyées en parallèle
+# par le client pendant que l'appelant continue d'ajouter des objets), avec nouvelles tentatives
+# pour les objets refusés et un résumé des échecs restants.
+
+MODES_LOT = ("fixed_size", "dynamic")
+
+
+def ouvrir_lot(collection, mode="fixed_size", taille_lot=200, requetes_concurrentes=2):
+    """
+    Contexte de batching de la collection. "dynamic" adapte la taille des lots à la charge du serveur,
+    "fixed_size" envoie des lots de `taille_lot` objets avec `requetes_concurrentes` requêtes simultanées.
+    """
+    if mode == "dynamic":
+        return collection.batch.dynamic()
+    return collection.batch.fixed_size(batch_size=taille_lot, concurrent_requests=requetes_concurrentes)
+
+
+def reinserer_echecs(collection, echecs, tentatives=3, mode="fixed_size", taille_lot=200, requetes_concurrentes=2):
+    """
+    Renvoie les objets refusés (`collection.batch.failed_objects`), avec une attente croissante entre les tentatives.
+    Les UUID sont conservés : un objet finalement inséré deux fois est simplement remplacé.
+    Retourne les échecs restants.
+    """
+    for tentative in range(tentatives):
+        if not echecs:
+            break
+        time.sleep(min(2 ** tentative, 10))
+        with ouvrir_lot(collection, mode, taille_lot, requetes_concurrentes) as lot:
+            for echec in echecs:
+                objet = echec.object_
+                lot.add_object(properties=objet.properties, vector=objet.vector, uuid=objet.uuid)
+        echecs = list(collection.batch.failed_objects)
+    return echecs
+
+
+def resumer_echecs(echecs, propriete="source"):
+    """Regroupe les échecs par valeur de `propriete` (le fichier source) : {valeur: {"nb": n, "message": premier message}}."""
+    resume = {}
+    for echec in echecs:
+        cle = (echec.object_.properties or {}).get(propriete, "inconnu")
+        entree = resume.setdefault(cle, {"nb": 0, "message": echec.message})
+        entree["nb"] += 1
+    return resume
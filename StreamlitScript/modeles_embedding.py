@@ -0,0 +1,122 @@
+"""
+Chargement du modèle de vectorisation avec différents backends CPU, derrière la même interface `encode` :
+  - "torch"     : SentenceTransformer PyTorch en float32 (référence) ;
+  - "onnx"      : même modèle exécuté par ONNX Runtime ;
+  - "int8"      : PyTorch avec quantification dynamique int8 des couches linéaires ;
+  - "onnx-int8" : ONNX Runtime avec un modèle quantifié int8 (exporté une fois dans le dossier de cache).
+
+Vérification de la précision et du débit d'un backend par rapport à la référence float32 :
+    python modeles_embedding.py --backend onnx-int8 [--textes paragraphes.txt]
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+BACKENDS = ("torch", "onnx", "int8", "onnx-int8")
+# Registre des modèles disponibles. La clé sert aussi de nom de vecteur (named vector) dans Weaviate.
+# Les modèles E5 attendent un préfixe différent pour les requêtes et pour les passages indexés.
+# "matryoshka": True indique un modèle dont les vecteurs peuvent être tronqués (sinon : projection PCA).
+MODELES = {
+    "bge_base_en": {"nom": "BAAI/bge-base-en-v1.5", "prefixe_requete": "", "prefixe_passage": ""},
+    "multilingual_e5_small": {"nom": "intfloat/multilingual-e5-small", "prefixe_requete": "query: ", "prefixe_passage": "passage: "},
+    "bge_m3": {"nom": "BAAI/bge-m3", "prefixe_requete": "", "prefixe_passage": ""},
+}
+# Similarité cosinus moyenne minimale attendue entre les vecteurs d'un backend et ceux du modèle float32
+SEUIL_SIMILARITE_MOYENNE = 0.99
+
+TEXTES_EXEMPLE = [
+    "Le montant de la caution provisoire est fixé à 50 000 dirhams.",
+    "Article 12 : Délai d'exécution des prestations.",
+    "Les offres doivent être déposées au bureau d'ordre avant la date limite de remise des plis.",
+    "Fourniture et installation de matériel informatique pour les services de la province.",
+    "Le dossier administratif comprend la déclaration sur l'honneur et l'attestation fiscale.",
+    "Bordereau des prix - détail estimatif : prix unitaire hors TVA.",
+    "Les travaux seront réceptionnés provisoirement après vérification par le maître d'ouvrage.",
+    "Pénalités de retard : un millième du montant du marché par jour calendaire de retard.",
+]
+
+
+def charger_modele(nom_modele, backend="torch", dossier_cache=None):
+    """Charge le modèle avec le backend demandé. Le résultat s'utilise comme un SentenceTransformer (`encode`)."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend inconnu : {backend} (valeurs possibles : {', '.join(BACKENDS)})")
+    if backend == "torch":
+        return SentenceTransformer(nom_modele, device="cpu")
+    if backend == "onnx":
+        return SentenceTransformer(nom_modele, device="cpu", backend="onnx")
+    if backend == "int8":
+        import torch
+        model = SentenceTransformer(nom_modele, device="cpu")
+        # Retourne une copie du modèle (toujours un SentenceTransformer) dont les couches Linear sont en int8
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    # "onnx-int8" : le modèle quantifié est exporté une seule fois, puis rechargé depuis le disque
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+    dossier_modele = Path(dossier_cache or "cache") / "modeles" / nom_modele.replace("/", "__")
+    nom_fichier = "onnx/model_qint8_avx2.onnx"
+    if not (dossier_modele / nom_fichier).exists():
+        model = SentenceTransformer(nom_modele, device="cpu", backend="onnx")
+        model.save(str(dossier_modele))
+        export_dynamic_quantized_onnx_model(model, "avx2", str(dossier_modele))
+    return SentenceTransformer(str(dossier_modele), device="cpu", backend="onnx", model_kwargs={"file_name": nom_fichier})
+
+
+def nom_cache(nom_modele, backend):
+    """Nom du modèle dans les clés du cache des vecteurs : un backend quantifié ne partage pas les entrées du float32."""
+    return nom_modele if backend == "torch" else f"{nom_modele}|{backend}"
+
+
+def verifier_precision(modele_reference, modele_candidat, textes):
+    """Compare les vecteurs d'un backend à ceux de la référence : similarité cosinus moyenne et minimale."""
+    reference = np.asarray(modele_reference.encode(textes, normalize_embeddings=True), dtype=np.float32)
+    candidat = np.asarray(modele_candidat.encode(textes, normalize_embeddings=True), dtype=np.float32)
+    similarites = np.sum(reference * candidat, axis=1)
+    return {
+        "similarite_moyenne": float(similarites.mean()),
+        "similarite_min": float(similarites.min()),
+        "conforme": bool(similarites.mean() >= SEUIL_SIMILARITE_MOYENNE)
+    }
+
+
+def mesurer_debit(model, textes, repetitions=3):
+    """Paragraphes vectorisés par seconde (meilleure de plusieurs passes)."""
+    model.encode(textes[:8])  # Échauffement
+    meilleure = float("inf")
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        model.encode(textes, batch_size=32)
+        meilleure = min(meilleure, time.perf_counter() - debut)
+    return len(textes) / meilleure
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare un backend de vectorisation au modèle float32 de référence.")
+    parser.add_argument("--modele", choices=MODELES, default="bge_base_en")
+    parser.add_argument("--backend", choices=BACKENDS, default="onnx-int8")
+    parser.add_argument("--textes", help="Fichier texte, un paragraphe par ligne (par défaut : exemples intégrés)")
+    parser.add_argument("--dossier-cache", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache"))
+    args = parser.parse_args()
+
+    if args.textes:
+        with open(args.textes, encoding="utf-8") as f:
+            textes = [ligne.strip() for ligne in f if len(ligne.strip()) > 10]
+    else:
+        textes = TEXTES_EXEMPLE * 32
+
+    nom_modele = MODELES[args.modele]["nom"]
+    textes = [MODELES[args.modele]["prefixe_passage"] + t for t in textes]
+    reference = charger_modele(nom_modele, "torch")
+    candidat = charger_modele(nom_modele, args.backend, args.dossier_cache)
+    precision = verifier_precision(reference, candidat, textes)
+    debit_reference = mesurer_debit(reference, textes)
+    debit_candidat = mesurer_debit(candidat, textes)
+
+    print(f"Modèle : {nom_modele} — {len(textes)} paragraphes")
+    print(f"  torch (float32) : {debit_reference:.0f} paragraphes/s")
+    print(f"  {args.backend} : {debit_candidat:.0f} paragraphes/s (x{debit_candidat / debit_reference:.1f})")
+    print(f"  Similarité cosinus avec float32 : moyenne {precision['similarite_moyenne']:.4f}, min {precision['similarite_min']:.4f}")
+    print("  ✅ Précision conforme" if precision["conforme"] else f"  ❌ Précision insuffisante (< {SEUIL_SIMILARITE_MOYENNE})")
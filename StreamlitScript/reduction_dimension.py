@@ -0,0 +1,190 @@
+"""
+Vecteurs de dimension réduite : moins de mémoire dans Weaviate et des requêtes HNSW plus rapides.
+  - PCA apprise sur les vecteurs déjà indexés du modèle, sauvegardée dans le dossier "projections" ;
+  - troncature (Matryoshka) pour les modèles du registre entraînés pour la supporter.
+
+Mesurer le rappel selon la dimension, puis apprendre la projection retenue :
+    python reduction_dimension.py benchmark --modele bge_base_en [--requetes requetes.txt]
+    python reduction_dimension.py apprendre --modele bge_base_en --dimension 256
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from modeles_embedding import MODELES
+
+DIMENSIONS_BENCHMARK = (64, 128, 256, 384, 512)
+
+
+def normaliser(vecteurs):
+    normes = np.linalg.norm(vecteurs, axis=1, keepdims=True)
+    return vecteurs / np.maximum(normes, 1e-12)
+
+
+def nom_vecteur(cle_modele, dimension=None):
+    """Nom du vecteur nommé dans Weaviate : une dimension réduite est un espace de vecteurs à part."""
+    return f"{cle_modele}_d{dimension}" if dimension else cle_modele
+
+
+class ProjectionPCA:
+    """Projection linéaire apprise (centrage + composantes principales), suivie d'une normalisation L2."""
+
+    def __init__(self, moyenne, composantes):
+        self.moyenne = np.asarray(moyenne, dtype=np.float32)
+        self.composantes = np.asarray(composantes, dtype=np.float32)
+        self.dimension = self.composantes.shape[0]
+
+    @classmethod
+    def apprendre(cls, vecteurs, dimension):
+        vecteurs = np.asarray(vecteurs, dtype=np.float64)
+        if dimension >= vecteurs.shape[1]:
+            raise ValueError(f"La dimension réduite ({dimension}) doit être inférieure à {vecteurs.shape[1]}")
+        moyenne = vecteurs.mean(axis=0)
+        centres = vecteurs - moyenne
+        # Vecteurs propres de la covariance (d x d), moins coûteux qu'une SVD des n paragraphes
+        valeurs, vecteurs_propres = np.linalg.eigh(centres.T @ centres / len(centres))
+        ordre = np.argsort(valeurs)[::-1][:dimension]
+        return cls(moyenne, vecteurs_propres[:, ordre].T)
+
+    def projeter(self, vecteurs):
+        vecteurs = np.atleast_2d(np.asarray(vecteurs, dtype=np.float32))
+        return normaliser((vecteurs - self.moyenne) @ self.composantes.T)
+
+    def sauvegarder(self, chemin):
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        np.savez(chemin, moyenne=self.moyenne, composantes=self.composantes)
+
+    @classmethod
+    def charger(cls, chemin):
+        donnees = np.load(chemin)
+        return cls(donnees["moyenne"], donnees["composantes"])
+
+
+class Troncature:
+    """Conserve les `dimension` premières composantes (modèles Matryoshka), puis normalise."""
+
+    def __init__(self, dimension):
+        self.dimension = dimension
+
+    def projeter(self, vecteurs):
+        vecteurs = np.atleast_2d(np.asarray(vecteurs, dtype=np.float32))
+        return normaliser(vecteurs[:, :self.dimension])
+
+
+def chemin_projection(dossier_projections, cle_modele, dimension):
+    return os.path.join(dossier_projections, f"pca_{cle_modele}_{dimension}.npz")
+
+
+def charger_reduction(cle_modele, dimension, dossier_projections):
+    """
+    Réduction à appliquer aux vecteurs du modèle (None si `dimension` est vide).
+    La projection PCA doit avoir été apprise au préalable : elle ne doit plus changer une fois des vecteurs indexés.
+    """
+    if not dimension:
+        return None
+    if MODELES[cle_modele].get("matryoshka"):
+        return Troncature(dimension)
+    chemin = chemin_projection(dossier_projections, cle_modele, dimension)
+    if not os.path.exists(chemin):
+        raise FileNotFoundError(
+            f"Projection introuvable : {chemin}. Lancez : python reduction_dimension.py apprendre "
+            f"--modele {cle_modele} --dimension {dimension}"
+        )
+    return ProjectionPCA.charger(chemin)
+
+
+def charger_vecteurs_indexes(client, cle_modele, nb_max, class_name="DocumentParagraph"):
+    """Vecteurs pleine dimension du modèle déjà présents dans Weaviate (au plus `nb_max`)."""
+    vecteurs = []
+    for obj in client.collections.get(class_name).iterator(include_vector=True, return_properties=[]):
+        vecteur = (obj.vector or {}).get(cle_modele)
+        if vecteur is not None:
+            vecteurs.append(vecteur)
+            if len(vecteurs) >= nb_max:
+                break
+    return np.asarray(vecteurs, dtype=np.float32)
+
+
+def top_k(requetes, corpus, k):
+    scores = requetes @ corpus.T
+    indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [set(ligne) for ligne in indices]
+
+
+def rappel_a_k(verite, approximation):
+    k = len(verite[0])
+    return float(np.mean([len(v & a) / k for v, a in zip(verite, approximation)]))
+
+
+def benchmark(corpus, requetes, k=10, dimensions=DIMENSIONS_BENCHMARK):
+    """
+    Rappel@k de la recherche exacte en dimension réduite par rapport à la pleine dimension
+    (PCA apprise sur le corpus et troncature), avec la mémoire par vecteur et le temps par requête.
+    """
+    corpus, requetes = normaliser(corpus), normaliser(requetes)
+    dimension_pleine = corpus.shape[1]
+    verite = top_k(requetes, corpus, k)
+    resultats = []
+    for dimension in [d for d in dimensions if d < dimension_pleine]:
+        for methode, reduction in (("pca", ProjectionPCA.apprendre(corpus, dimension)), ("troncature", Troncature(dimension))):
+            corpus_reduit = reduction.projeter(corpus)
+            debut = time.perf_counter()
+            approximation = top_k(reduction.projeter(requetes), corpus_reduit, k)
+            duree = time.perf_counter() - debut
+            resultats.append({
+                "methode": methode,
+                "dimension": dimension,
+                "rappel": rappel_a_k(verite, approximation),
+                "octets_par_vecteur": dimension * 4,
+                "gain_memoire": dimension_pleine / dimension,
+                "ms_par_requete": duree * 1000 / len(requetes)
+            })
+    return resultats
+
+
+if __name__ == "__main__":
+    import weaviate
+
+    parser = argparse.ArgumentParser(description="Réduction de dimension des vecteurs de paragraphes.")
+    parser.add_argument("action", choices=("benchmark", "apprendre"))
+    parser.add_argument("--modele", choices=MODELES, required=True)
+    parser.add_argument("--dimension", type=int, help="Dimension de la projection à apprendre")
+    parser.add_argument("--nb-vecteurs", type=int, default=50_000, help="Nombre maximal de vecteurs indexés utilisés")
+    parser.add_argument("--requetes", help="Benchmark : fichier de requêtes (une par ligne). Par défaut : 200 paragraphes tirés du corpus")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dossier-projections", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "projections"))
+    args = parser.parse_args()
+
+    with weaviate.connect_to_local(port=8080, grpc_port=50051) as client:
+        vecteurs = charger_vecteurs_indexes(client, args.modele, args.nb_vecteurs)
+    if len(vecteurs) < 2 * args.k:
+        raise SystemExit(f"Pas assez de vecteurs '{args.modele}' indexés ({len(vecteurs)}) : indexez d'abord des dossiers.")
+
+    if args.action == "apprendre":
+        if not args.dimension:
+            raise SystemExit("--dimension est obligatoire pour apprendre une projection.")
+        projection = ProjectionPCA.apprendre(normaliser(vecteurs), args.dimension)
+        chemin = chemin_projection(args.dossier_projections, args.modele, args.dimension)
+        projection.sauvegarder(chemin)
+        print(f"✅ Projection {vecteurs.shape[1]} -> {args.dimension} apprise sur {len(vecteurs)} vecteurs : {chemin}")
+    else:
+        if args.requetes:
+            from modeles_embedding import charger_modele
+            with open(args.requetes, encoding="utf-8") as f:
+                textes = [MODELES[args.modele]["prefixe_requete"] + ligne.strip() for ligne in f if ligne.strip()]
+            requetes = np.asarray(charger_modele(MODELES[args.modele]["nom"]).encode(textes), dtype=np.float32)
+            corpus = vecteurs
+        else:
+            # Requêtes tirées du corpus puis retirées de celui-ci, pour ne pas se retrouver elles-mêmes
+            melange = np.random.default_rng(0).permutation(len(vecteurs))
+            nb_requetes = min(200, len(vecteurs) // 5)
+            requetes, corpus = vecteurs[melange[:nb_requetes]], vecteurs[melange[nb_requetes:]]
+
+        print(f"Modèle : {MODELES[args.modele]['nom']} — {len(corpus)} paragraphes, {len(requetes)} requêtes, "
+              f"dimension pleine {corpus.shape[1]}")
+        print(f"{'méthode':<11} {'dim':>5} {'rappel@' + str(args.k):>10} {'octets/vecteur':>15} {'gain mémoire':>13} {'ms/requête':>11}")
+        for r in benchmark(corpus, requetes, args.k):
+            print(f"{r['methode']:<11} {r['dimension']:>5} {r['rappel']:>10.3f} {r['octets_par_vecteur']:>15} "
+                  f"{'x' + format(r['gain_memoire'], '.1f'):>13} {r['ms_par_requete']:>11.2f}")
@@ -0,0 +1,166 @@
+"""
+Revectorisation des paragraphes déjà indexés avec un autre modèle du registre, sans retélécharger ni réextraire
+les documents : le texte est relu depuis Weaviate et le vecteur nommé du modèle est ajouté à chaque objet.
+Peut tourner en arrière-plan pendant que l'application est utilisée :
+    nohup python reindexation.py --modele multilingual_e5_small > reindexation.log 2>&1 &
+"""
+import argparse
+import os
+
+import weaviate
+import weaviate.classes.config as wvc
+import weaviate.classes.query as wq
+from dotenv import load_dotenv
+from weaviate.util import generate_uuid5
+
+from cache_local import CacheEmbeddings
+from modeles_embedding import MODELES, BACKENDS, charger_modele, nom_cache
+from reduction_dimension import charger_reduction, nom_vecteur
+from index_vectoriel import config_index_hnsw
+from insertion_weaviate import ouvrir_lot, reinserer_echecs, resumer_echecs
+from vectorisation import EncodeurParBuckets
+
+CLASS_NAME = "DocumentParagraph"
+DOSSIERS_CLASS_NAME = "DossierIndexe"
+PROPRIETES = ["content", "source", "tender_ref"]
+
+
+def assurer_vecteurs_nommes(collection, noms, vector_index_config=None):
+    """Ajoute à la collection les vecteurs nommés manquants (modèle ajouté au registre, nouvelle dimension réduite)."""
+    existants = collection.config.get().vector_config or {}
+    for nom in dict.fromkeys(noms):
+        if nom not in existants:
+            collection.config.add_vector(
+                vector_config=wvc.Configure.NamedVectors.none(name=nom, vector_index_config=vector_index_config)
+            )
+
+
+def parcourir_paragraphes(collection, tender_ref=None, taille_page=500):
+    """Parcourt les paragraphes (avec leurs vecteurs), de toute la collection ou d'un seul appel d'offres."""
+    if tender_ref is None:
+        yield from collection.iterator(include_vector=True, return_properties=PROPRIETES)
+        return
+    # Le curseur de l'itérateur ne se combine pas avec un filtre : pagination par offset. Les objets réécrits
+    # (nouveau vecteur nommé) peuvent changer de place dans les résultats : tous les UUID de l'appel d'offres
+    # sont relevés avant la première réécriture, puis les objets sont relus par UUID
+    filtre = wq.Filter.by_property("tender_ref").equal(tender_ref)
+    uuids = []
+    offset = 0
+    while True:
+        reponse = collection.query.fetch_objects(filters=filtre, limit=taille_page, offset=offset, return_properties=[])
+        uuids.extend(obj.uuid for obj in reponse.objects)
+        if len(reponse.objects) < taille_page:
+            break
+        offset += taille_page
+    for debut in range(0, len(uuids), taille_page):
+        reponse = collection.query.fetch_objects(
+            filters=wq.Filter.by_id().contains_any(uuids[debut:debut + taille_page]), limit=taille_page,
+            include_vector=True, return_properties=PROPRIETES
+        )
+        yield from reponse.objects
+
+
+def ajouter_modele_aux_dossiers(client, tender_refs, nom, dossiers_class_name=DOSSIERS_CLASS_NAME):
+    """Ajoute le vecteur nommé `nom` à la liste `modeles` des marqueurs des appels d'offres revectorisés."""
+    dossiers = client.collections.get(dossiers_class_name)
+    for tender_ref in tender_refs:
+        marqueur = dossiers.query.fetch_object_by_id(generate_uuid5(tender_ref))
+        if marqueur is None:
+            continue
+        modeles = set(marqueur.properties.get("modeles") or [])
+        if nom not in modeles:
+            dossiers.data.update(uuid=marqueur.uuid, properties={"modeles": sorted(modeles | {nom})})
+
+
+def reindexer(client, cle_modele, model, cache=None, tender_ref=None, forcer=False, taille_lot=256,
+              class_name=CLASS_NAME, dossiers_class_name=DOSSIERS_CLASS_NAME, progression=None, reduction=None,
+              vector_index_config=None):
+    """
+    Calcule le vecteur du modèle `cle_modele` (réduit par `reduction` si fournie) pour les paragraphes
+    qui ne l'ont pas encore (tous si `forcer`). Les objets sont réécrits avec le même UUID,
+    leurs autres vecteurs nommés sont conservés. Retourne le nombre de paragraphes revectorisés.
+    `vector_index_config` s'applique si le vecteur nommé doit être créé.
+    """
+    collection = client.collections.get(class_name)
+    nom = nom_vecteur(cle_modele, reduction.dimension if reduction else None)
+    assurer_vecteurs_nommes(collection, [nom], vector_index_config)
+    prefixe = MODELES[cle_modele]["prefixe_passage"]
+    encodeur = EncodeurParBuckets(model)
+    tender_refs = set()
+    total = 0
+
+    def ecrire(lot, lot_weaviate):
+        textes = [prefixe + obj.properties["content"] for obj in lot]
+        if cache is not None:
+            vecteurs = cache.encoder(encodeur, textes, show_progress_bar=False)
+        else:
+            vecteurs = encodeur.encode(textes, show_progress_bar=False)
+        if reduction is not None:
+            vecteurs = reduction.projeter(vecteurs)
+        for obj, vecteur in zip(lot, vecteurs):
+            lot_weaviate.add_object(properties=obj.properties, uuid=obj.uuid, vector={**(obj.vector or {}), nom: vecteur.tolist()})
+
+    lot = []
+    with ouvrir_lot(collection) as lot_weaviate:
+        for obj in parcourir_paragraphes(collection, tender_ref):
+            tender_refs.add(obj.properties.get("tender_ref"))
+            if not forcer and nom in (obj.vector or {}):
+                continue
+            lot.append(obj)
+            if len(lot) >= taille_lot:
+                ecrire(lot, lot_weaviate)
+                total += len(lot)
+                lot = []
+                if progression:
+                    progression(total)
+        if lot:
+            ecrire(lot, lot_weaviate)
+            total += len(lot)
+            if progression:
+                progression(total)
+
+    echecs = reinserer_echecs(collection, list(collection.batch.failed_objects))
+    if echecs:
+        # Les marqueurs ne sont pas mis à jour : une nouvelle exécution reprendra les paragraphes manquants
+        detail = ", ".join(f"{source} ({e['nb']})" for source, e in resumer_echecs(echecs).items())
+        raise RuntimeError(f"{len(echecs)} paragraphe(s) non réécrit(s) : {detail} — {echecs[0].message}")
+
+    ajouter_modele_aux_dossiers(client, tender_refs - {None}, nom, dossiers_class_name)
+    return total
+
+
+if __name__ == "__main__":
+    # Même fichier .env que l'application : backend, dimension réduite et réglages d'index identiques
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Revectorise les paragraphes indexés avec un modèle du registre.")
+    parser.add_argument("--modele", choices=MODELES, required=True)
+    parser.add_argument("--backend", choices=BACKENDS, default=os.getenv("BACKEND_EMBEDDING", "torch"))
+    parser.add_argument("--tender", help="Limiter à un appel d'offres (tender_ref)")
+    parser.add_argument("--forcer", action="store_true", help="Recalculer aussi les vecteurs déjà présents")
+    parser.add_argument("--taille-lot", type=int, default=256)
+    parser.add_argument("--dimension", type=int, default=int(os.getenv("DIMENSION_REDUITE", "0")) or None,
+                        help="Dimension réduite (voir reduction_dimension.py)")
+    parser.add_argument("--dossier-cache", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache"))
+    parser.add_argument("--dossier-projections", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "projections"))
+    args = parser.parse_args()
+
+    nom_modele = MODELES[args.modele]["nom"]
+    model = charger_modele(nom_modele, args.backend, args.dossier_cache)
+    reduction = charger_reduction(args.modele, args.dimension, args.dossier_projections)
+    os.makedirs(args.dossier_cache, exist_ok=True)
+    cache = CacheEmbeddings(os.path.join(args.dossier_cache, "embeddings.sqlite"), nom_cache(nom_modele, args.backend), 500_000)
+
+    with weaviate.connect_to_local(port=8080, grpc_port=50051) as client:
+        if not client.collections.exists(CLASS_NAME):
+            raise SystemExit("Aucun paragraphe indexé : lancez d'abord un traitement depuis l'application.")
+        total = reindexer(
+            client, args.modele, model, cache, args.tender, args.forcer, args.taille_lot,
+            progression=lambda n: print(f"  {n} paragraphes revectorisés...", flush=True), reduction=reduction,
+            # Mêmes réglages d'index que l'application (variables d'environnement)
+            vector_index_config=config_index_hnsw(
+                os.getenv("COMPRESSION_VECTEURS", "aucune"), int(os.getenv("HNSW_EF", "-1")),
+                int(os.getenv("HNSW_EF_CONSTRUCTION", "128")), int(os.getenv("HNSW_MAX_CONNECTIONS", "32")),
+                int(os.getenv("RESCORE_LIMIT", "256"))
+            )
+        )
+    print(f"✅ {total} paragraphes revectorisés avec {nom_modele} (vecteur '{nom_vecteur(args.modele, args.dimension)}').")
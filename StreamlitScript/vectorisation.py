@@ -0,0 +1,122 @@
+import time
+
+import numpy as np
+
+
+def longueurs_tokens(model, textes):
+    """Nombre de tokens de chaque texte selon le tokenizer du modèle (tronqué à sa longueur maximale)."""
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        return [len(t.split()) for t in textes]
+    max_length = getattr(model, "max_seq_length", None) or 512
+    encodage = tokenizer(list(textes), add_special_tokens=True, truncation=True, max_length=max_length)
+    return [len(ids) for ids in encodage["input_ids"]]
+
+
+class MicroBatcher:
+    """
+    Accumule les paragraphes de tous les fichiers en cours de traitement et décide quand lancer un encodage :
+    dès que `taille_max` paragraphes sont en attente, ou dès que le plus ancien attend depuis `delai_max` secondes.
+    """
+
+    def __init__(self, taille_max, delai_max):
+        self.taille_max = taille_max
+        self.delai_max = delai_max
+        self._elements = []
+        self._debut = None
+
+    def __len__(self):
+        return len(self._elements)
+
+    def ajouter(self, elements):
+        if elements and not self._elements:
+            self._debut = time.monotonic()
+        self._elements.extend(elements)
+
+    def temps_restant(self):
+        """Secondes avant que le lot en cours atteigne son délai maximal (None si rien n'est en attente)."""
+        if not self._elements:
+            return None
+        return max(0.0, self._debut + self.delai_max - time.monotonic())
+
+    def pret(self):
+        return len(self._elements) >= self.taille_max or (bool(self._elements) and self.temps_restant() == 0.0)
+
+    def extraire_lot(self):
+        lot, self._elements = self._elements[:self.taille_max], self._elements[self.taille_max:]
+        self._debut = time.monotonic() if self._elements else None
+        return lot
+
+    def retirer(self, condition):
+        """Retire les éléments en attente pour lesquels `condition(element)` est vraie."""
+        self._elements = [e for e in self._elements if not condition(e)]
+        if not self._elements:
+            self._debut = None
+
+
+def tokens_avec_padding(longueurs, taille_sous_lot):
+    """Nombre total de tokens traités (padding compris) si les textes sont encodés dans cet ordre par sous-lots."""
+    return sum(
+        max(longueurs[i:i + taille_sous_lot]) * len(longueurs[i:i + taille_sous_lot])
+        for i in range(0, len(longueurs), taille_sous_lot)
+    )
+
+
+class EncodeurParBuckets:
+    """
+    Enveloppe un modèle SentenceTransformer derrière la même méthode `encode`.
+    Les textes sont répartis en buckets de longueur (en tokens), chaque bucket est encodé séparément
+    avec un sous-lot d'autant plus grand que les textes sont courts, puis l'ordre d'origine est restitué.
+    Le ratio de padding est mesuré avant et après les buckets. "Avant" correspond à l'ancien appel direct
+    à SentenceTransformer.encode, qui trie déjà le lot par longueur puis l'encode par sous-lots de 32.
+    """
+
+    def __init__(self, model, bornes=(32, 64, 128, 256), taille_sous_lot=32, budget_tokens=8192):
+        self.model = model
+        self.bornes = sorted(bornes)
+        self.taille_sous_lot = taille_sous_lot
+        self.budget_tokens = budget_tokens
+        self.tokens_reels = 0
+        self.tokens_sans_buckets = 0
+        self.tokens_buckets = 0
+
+    def _bucket(self, longueur):
+        for indice, borne in enumerate(self.bornes):
+            if longueur <= borne:
+                return indice
+        return len(self.bornes)
+
+    def encode(self, textes, **kwargs):
+        kwargs.pop("batch_size", None)
+        textes = list(textes)
+        if not textes:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        longueurs = longueurs_tokens(self.model, textes)
+        self.tokens_reels += sum(longueurs)
+        self.tokens_sans_buckets += tokens_avec_padding(sorted(longueurs, reverse=True), self.taille_sous_lot)
+
+        buckets = {}
+        for indice, longueur in enumerate(longueurs):
+            buckets.setdefault(self._bucket(longueur), []).append(indice)
+
+        resultat = None
+        for numero_bucket, indices in sorted(buckets.items()):
+            indices.sort(key=lambda i: longueurs[i])
+            # Sous-lot borné par un budget de tokens : plus de textes par passe quand ils sont courts
+            borne = self.bornes[numero_bucket] if numero_bucket < len(self.bornes) else max(longueurs[i] for i in indices)
+            taille = max(self.taille_sous_lot, min(256, self.budget_tokens // max(1, borne)))
+            self.tokens_buckets += tokens_avec_padding([longueurs[i] for i in indices], taille)
+            vecteurs = np.asarray(self.model.encode([textes[i] for i in indices], batch_size=taille, **kwargs), dtype=np.float32)
+            if resultat is None:
+                resultat = np.empty((len(textes), vecteurs.shape[1]), dtype=np.float32)
+            resultat[indices] = vecteurs
+        return resultat
+
+    def statistiques(self):
+        """Part des tokens de padding, sans les buckets (lot trié, sous-lots de 32) et avec les buckets."""
+        def ratio(total):
+            return 1 - self.tokens_reels / total if total else 0.0
+        return {
+            "padding_sans_buckets": ratio(self.tokens_sans_buckets),
+            "padding_buckets": ratio(self.tokens_buckets)
+        }
@@ -1,96 +1,212 @@
 import os
 import json
+import random
+import shutil
+import threading
 import requests
 import zipfile
-import io
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 
-# 1. Charger les données JSON depuis le fichier
-json_path = "resultats_uniques.json"
-try:
-    with open(json_path, "r", encoding="utf-8") as f:
-        appels_offres = json.load(f)
-except Exception as e:
-    print(f"Erreur lors de la lecture du fichier {json_path}: {e}")
-    exit(1)
-
-# 2. Créer le dossier principal
-dossier_global = "TousDossiers"
-os.makedirs(dossier_global, exist_ok=True)
-
-# Compteurs pour suivre les réussites et les échecs
-dossiers_telecharges_succes = 0
-dossiers_echoues = 0
-
-# 3. Boucle sur chaque appel d'offres
-for ao in appels_offres:
-    reference = ao.get("reference") or ao.get("refConsultation") or ao.get("consId") or "SansReference"
-    url_dossier = ao.get("urldossierDirect")
-
-    if not url_dossier:
-        print(f"Attention: URL manquante pour l'élément {ao}. On passe au suivant.")
-        continue
-
-    print(f"--- Traitement de la référence : {reference} ---")
-
-    # Nettoyer le nom du dossier
-    nom_sous_dossier = str(reference).replace('/', '_').replace('\\', '_')
-    chemin_sous_dossier = os.path.join(dossier_global, nom_sous_dossier)
+TAILLE_BLOC = 1024 * 1024  # Écriture sur disque par blocs de 1 Mo
+MARQUEUR_COMPLET = ".complete"  # Écrit dans le sous-dossier une fois l'archive entièrement décompressée
+
+# --- Paramètres du téléchargement en masse ---
+NB_TELECHARGEMENTS_SIMULTANES = 8   # Nombre maximal de dossiers téléchargés en même temps
+INTERVALLE_MIN_PAR_HOTE = 0.5       # Délai minimal (s) entre deux requêtes vers un même hôte
+MAX_RETRIES = 10
+DELAI_BASE = 1.0                    # Premier délai d'attente (s) avant une nouvelle tentative
+DELAI_MAX = 60.0                    # Plafond du délai d'attente (s)
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept": "application/zip,application/octet-stream,application/x-zip-compressed,*/*",
+    "Referer": "https://www.marchespublics.gov.ma/",
+    "Origin": "https://www.marchespublics.gov.ma",
+    "Connection": "keep-alive"
+}
+
+
+class LimiteurParHote:
+    """Espace les requêtes vers un même hôte d'au moins `intervalle` secondes, quel que soit le thread."""
+
+    def __init__(self, intervalle):
+        self.intervalle = intervalle
+        self._prochain_creneau = {}
+        self._lock = threading.Lock()
+
+    def attendre(self, url):
+        hote = urlparse(url).netloc
+        with self._lock:
+            maintenant = time.monotonic()
+            creneau = max(maintenant, self._prochain_creneau.get(hote, 0.0))
+            self._prochain_creneau[hote] = creneau + self.intervalle
+        if creneau > maintenant:
+            time.sleep(creneau - maintenant)
+
+
+def creer_session(nb_connexions):
+    """Session partagée : les connexions HTTP sont réutilisées (keep-alive) d'un dossier à l'autre."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=nb_connexions, pool_maxsize=nb_connexions)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+def delai_backoff(tentative):
+    """Backoff exponentiel avec jitter ("full jitter") : évite que tous les threads réessaient en même temps."""
+    return random.uniform(0, min(DELAI_MAX, DELAI_BASE * 2 ** tentative))
+
+
+def telecharger_fichier(session, url, chemin_destination, timeout=60):
+    """
+    Télécharge `url` en flux vers `chemin_destination` (mémoire constante).
+    Si un fichier partiel existe déjà, le téléchargement reprend à partir de sa taille (en-tête HTTP Range).
+    Retourne le Content-Type de la réponse.
+    """
+    deja_recu = os.path.getsize(chemin_destination) if os.path.exists(chemin_destination) else 0
+    entetes = {"Range": f"bytes={deja_recu}-"} if deja_recu else {}
+    with session.get(url, headers=entetes, stream=True, timeout=timeout) as response:
+        if deja_recu and response.status_code == 416:
+            # Plage non satisfaisable : le fichier est déjà complet
+            return response.headers.get("Content-Type", "")
+        response.raise_for_status()
+        # Si le serveur ignore l'en-tête Range (réponse 200), on repart de zéro
+        mode = "ab" if deja_recu and response.status_code == 206 else "wb"
+        with open(chemin_destination, mode) as f:
+            for bloc in response.iter_content(chunk_size=TAILLE_BLOC):
+                f.write(bloc)
+        return response.headers.get("Content-Type", "")
+
+
+def deja_telecharge(chemin_sous_dossier):
+    """Un dossier est considéré comme téléchargé seulement si sa décompression est allée jusqu'au bout (marqueur)."""
+    return os.path.isfile(os.path.join(chemin_sous_dossier, MARQUEUR_COMPLET))
+
+
+def traiter_appel_offres(session, limiteur, reference, url_dossier, chemin_sous_dossier):
+    """Télécharge et décompresse un dossier. Retourne True en cas de succès."""
     os.makedirs(chemin_sous_dossier, exist_ok=True)
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept": "application/zip,application/octet-stream,application/x-zip-compressed,*/*",
-        "Referer": "https://www.marchespublics.gov.ma/",
-        "Origin": "https://www.marchespublics.gov.ma",
-        "Connection": "keep-alive"
-    }
-
-    response = None
-    max_retries = 10  # Augmenter le nombre de tentatives à 10
-    for attempt in range(max_retries):
+    # Le dossier est écrit sur disque en flux ; un téléchargement interrompu reprend là où il s'est arrêté
+    chemin_zip = os.path.join(chemin_sous_dossier, "dossier.zip.part")
+    content_type = None
+    for attempt in range(MAX_RETRIES):
         try:
-            print(f"📥 Téléchargement du fichier depuis {url_dossier}... (tentative {attempt+1})")
-            response = requests.get(url_dossier, headers=headers, timeout=60)
-            response.raise_for_status()
-            dossiers_telecharges_succes += 1
+            limiteur.attendre(url_dossier)
+            print(f"📥 [{reference}] Téléchargement depuis {url_dossier}... (tentative {attempt+1})")
+            content_type = telecharger_fichier(session, url_dossier, chemin_zip)
             break  # Succès, on sort de la boucle
         except requests.exceptions.RequestException as e:
-            print(f"❌ Erreur de téléchargement pour {reference}: {e}")
-            if attempt < max_retries - 1:
-                print("Nouvelle tentative dans 5 secondes...")
-                time.sleep(5)
+            print(f"❌ [{reference}] Erreur de téléchargement : {e}")
+            if attempt < MAX_RETRIES - 1:
+                delai = delai_backoff(attempt)
+                print(f"[{reference}] Nouvelle tentative dans {delai:.1f} secondes...")
+                time.sleep(delai)
             else:
-                print("Abandon du téléchargement pour ce dossier.")
-                dossiers_echoues += 1
-                response = None
-
-    if response is None:
-        continue
+                print(f"[{reference}] Abandon du téléchargement (le fichier partiel est conservé pour reprise).")
+                return False
 
-    content_type = response.headers.get("Content-Type", "")
-    is_zip = ("zip" in content_type) or (response.content[:4] == b'PK\x03\x04')
+    with open(chemin_zip, "rb") as f:
+        is_zip = ("zip" in content_type) or (f.read(4) == b'PK\x03\x04')
 
-    if is_zip:
-        fichier_zip = io.BytesIO(response.content)
-        print(f"📦 Décompression des fichiers dans {chemin_sous_dossier}...")
-        try:
-            with zipfile.ZipFile(fichier_zip, 'r') as zip_ref:
-                zip_ref.extractall(chemin_sous_dossier)
-            print(f"✅ Succès pour la référence {reference} !")
-        except zipfile.BadZipFile:
-            print(f"❌ Erreur: Le fichier téléchargé pour {reference} n'est pas un fichier ZIP valide.")
-            dossiers_echoues += 1
-    else:
+    if not is_zip:
         # Sauvegarde pour inspection
-        with open(os.path.join(chemin_sous_dossier, "downloaded_file_unknown.bin"), "wb") as file:
-            file.write(response.content)
-        print(f"❌ Le fichier téléchargé pour {reference} n'est pas un ZIP valide (Content-Type: {content_type}). Fichier sauvegardé pour inspection.")
-        dossiers_echoues += 1
+        os.replace(chemin_zip, os.path.join(chemin_sous_dossier, "downloaded_file_unknown.bin"))
+        print(f"❌ [{reference}] Le fichier téléchargé n'est pas un ZIP valide (Content-Type: {content_type}). Fichier sauvegardé pour inspection.")
+        return False
+
+    print(f"📦 [{reference}] Décompression des fichiers dans {chemin_sous_dossier}...")
+    try:
+        with zipfile.ZipFile(chemin_zip, 'r') as zip_ref:
+            zip_ref.extractall(chemin_sous_dossier)
+    except zipfile.BadZipFile:
+        # Archive complète mais corrompue (éventuellement après l'écriture de quelques fichiers) : tout le
+        # sous-dossier est supprimé, sinon la reprise suivante (Range au-delà de la fin, réponse 416) considérerait
+        # l'archive comme terminée et échouerait de nouveau
+        shutil.rmtree(chemin_sous_dossier, ignore_errors=True)
+        print(f"❌ [{reference}] Le fichier téléchargé n'est pas un fichier ZIP valide (supprimé, il sera retéléchargé).")
+        return False
+    os.remove(chemin_zip)
+    # Un fichier non-ZIP sauvegardé par une exécution précédente n'a plus lieu d'être
+    chemin_inconnu = os.path.join(chemin_sous_dossier, "downloaded_file_unknown.bin")
+    if os.path.exists(chemin_inconnu):
+        os.remove(chemin_inconnu)
+    with open(os.path.join(chemin_sous_dossier, MARQUEUR_COMPLET), "w"):
+        pass
+    print(f"✅ Succès pour la référence {reference} !")
+    return True
+
 
-    # Afficher le nombre de dossiers réussis et échoués à chaque tentative
-    print(f"📊 Résultats jusqu'à maintenant : {dossiers_telecharges_succes} dossiers téléchargés avec succès, {dossiers_echoues} dossiers échoués.")
+if __name__ == "__main__":
+    # 1. Charger les données JSON depuis le fichier
+    json_path = "resultats_uniques.json"
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            appels_offres = json.load(f)
+    except Exception as e:
+        print(f"Erreur lors de la lecture du fichier {json_path}: {e}")
+        exit(1)
+
+    # 2. Créer le dossier principal
+    dossier_global = "TousDossiers"
+    os.makedirs(dossier_global, exist_ok=True)
+
+    # 3. Préparer la liste des dossiers à télécharger
+    taches = []
+    chemins_taches = set()
+    dossiers_deja_presents = 0
+    for ao in appels_offres:
+        reference = ao.get("reference") or ao.get("refConsultation") or ao.get("consId") or "SansReference"
+        url_dossier = ao.get("urldossierDirect")
+        if not url_dossier:
+            print(f"Attention: URL manquante pour l'élément {ao}. On passe au suivant.")
+            continue
+        # Nettoyer le nom du dossier
+        nom_sous_dossier = str(reference).replace('/', '_').replace('\\', '_')
+        chemin_sous_dossier = os.path.join(dossier_global, nom_sous_dossier)
+        if deja_telecharge(chemin_sous_dossier):
+            dossiers_deja_presents += 1
+            continue
+        # Deux références identiques (ou qui ne diffèrent que par "/" et "\\") écriraient le même fichier .part
+        # depuis deux threads : une seule tâche par sous-dossier
+        cle_chemin = os.path.normcase(os.path.abspath(chemin_sous_dossier))
+        if cle_chemin in chemins_taches:
+            print(f"Attention: le dossier {chemin_sous_dossier} est déjà prévu pour une autre entrée. On passe au suivant.")
+            continue
+        chemins_taches.add(cle_chemin)
+        taches.append((reference, url_dossier, chemin_sous_dossier))
+
+    print(f"--- {len(taches)} dossier(s) à télécharger, {dossiers_deja_presents} déjà présent(s) ---")
+
+    # 4. Téléchargements concurrents (nombre borné), avec une session et un limiteur de débit partagés
+    session = creer_session(NB_TELECHARGEMENTS_SIMULTANES)
+    limiteur = LimiteurParHote(INTERVALLE_MIN_PAR_HOTE)
+    dossiers_telecharges_succes = 0
+    dossiers_echoues = 0
+    with ThreadPoolExecutor(max_workers=NB_TELECHARGEMENTS_SIMULTANES) as executor:
+        futures = {
+            executor.submit(traiter_appel_offres, session, limiteur, reference, url, chemin): reference
+            for reference, url, chemin in taches
+        }
+        for future in as_completed(futures):
+            try:
+                succes = future.result()
+            except Exception as e:
+                print(f"❌ [{futures[future]}] Erreur inattendue : {e}")
+                succes = False
+            if succes:
+                dossiers_telecharges_succes += 1
+            else:
+                dossiers_echoues += 1
+            # Afficher le nombre de dossiers réussis et échoués au fur et à mesure
+            print(f"📊 Résultats jusqu'à maintenant : {dossiers_telecharges_succes} dossiers téléchargés avec succès, {dossiers_echoues} dossiers échoués.")
+    session.close()
 
-# Afficher le total à la fin du script
-print("\n--- Script terminé. ---")
-print(f"📊 Résultats finaux : {dossiers_telecharges_succes} dossiers téléchargés avec succès, {dossiers_echoues} dossiers échoués.")
+    # Afficher le total à la fin du script
+    print("\n--- Script terminé. ---")
+    print(f"📊 Résultats finaux : {dossiers_telecharges_succes} dossiers téléchargés avec succès, {dossiers_echoues} dossiers échoués.")
@@ -16,6 +16,14 @@ from pdf2image import convert_from_path
 # --- Initialisation ---
 model = SentenceTransformer("BAAI/bge-base-en-v1.5")
 CLASS_NAME = "DocumentParagraph"
+
+# AJOUT : Réglages de l'index HNSW et compression des vecteurs ("aucune", "pq", "bq" ou "sq")
+# Avec compression, les vecteurs d'origine restent sur disque et servent à re-classer les meilleurs candidats.
+COMPRESSION_VECTEURS = os.getenv("COMPRESSION_VECTEURS", "aucune")
+HNSW_EF = int(os.getenv("HNSW_EF", "-1"))  # -1 : ef dynamique
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "128"))
+HNSW_MAX_CONNECTIONS = int(os.getenv("HNSW_MAX_CONNECTIONS", "32"))
+RESCORE_LIMIT = int(os.getenv("RESCORE_LIMIT", "256"))
 FILES_DIRECTORY = os.path.join(os.path.dirname(__file__), "documents")
 
 # S'assurer que le répertoire des documents existe
@@ -141,6 +149,35 @@ def traiter_fichier(client, chemin_fichier):
     doc_collection.data.insert_many(objects_to_insert)
     return len(objects_to_insert)
 
+def config_index_vectoriel():
+    # BQ ne demande pas d'apprentissage : elle est activée dès la création.
+    # PQ et SQ sont apprises sur les vecteurs importés, puis activées après l'import (voir activer_compression).
+    quantizer = None
+    if COMPRESSION_VECTEURS == "bq":
+        quantizer = wvc.Configure.VectorIndex.Quantizer.bq(rescore_limit=RESCORE_LIMIT)
+    return wvc.Configure.VectorIndex.hnsw(
+        ef=HNSW_EF,
+        ef_construction=HNSW_EF_CONSTRUCTION,
+        max_connections=HNSW_MAX_CONNECTIONS,
+        quantizer=quantizer
+    )
+
+def activer_compression(client, nb_paragraphes):
+    if COMPRESSION_VECTEURS == "pq":
+        quantizer = wvc.Reconfigure.VectorIndex.Quantizer.pq(training_limit=nb_paragraphes)
+    elif COMPRESSION_VECTEURS == "sq":
+        quantizer = wvc.Reconfigure.VectorIndex.Quantizer.sq(rescore_limit=RESCORE_LIMIT, training_limit=nb_paragraphes)
+    else:
+        return
+    # Weaviate a besoin d'au moins 256 vecteurs pour apprendre les centroïdes
+    if nb_paragraphes < 256:
+        print(f"⚠️ Trop peu de paragraphes ({nb_paragraphes}) pour activer la compression {COMPRESSION_VECTEURS.upper()}.")
+        return
+    client.collections.get(CLASS_NAME).config.update(
+        vector_index_config=wvc.Reconfigure.VectorIndex.hnsw(quantizer=quantizer)
+    )
+    print(f"🗜️ Compression {COMPRESSION_VECTEURS.upper()} activée.")
+
 # --- Exécution principale ---
 if __name__ == "__main__":
     with weaviate.connect_to_local(port=8080, grpc_port=50051) as client:
@@ -158,7 +195,8 @@ if __name__ == "__main__":
                 wvc.Property(name="content", data_type=wvc.DataType.TEXT),
                 wvc.Property(name="source", data_type=wvc.DataType.TEXT)
             ],
-            vectorizer_config=wvc.Configure.Vectorizer.none()
+            vectorizer_config=wvc.Configure.Vectorizer.none(),
+            vector_index_config=config_index_vectoriel()
         )
         print("Collection créée.")
 
@@ -178,3 +216,4 @@ if __name__ == "__main__":
 
         print(f"\n--- Fin du traitement ---")
         print(f"📊 Total des paragraphes indexés : {total_para}")
+        activer_compression(client, total_para)